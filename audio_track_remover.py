@@ -5,17 +5,22 @@ Audio Track Remover Tool
 用于删除MKV、MP4等视频文件中的不需要的音轨
 
 支持两种模式：
-- 命令行模式：python audio_track_remover.py <video_file>
+- 命令行模式：python audio_track_remover.py --cli <video_file> [<video_file> ...]
+  （文件列表为 - 时从标准输入逐行读取，例如 media_catalog.py query 的输出）
+- 提取模式：python audio_track_remover.py --extract <video_file> [--tracks 2,3] [--clean]
 - GUI模式：python audio_track_remover.py --gui
 """
 
 import os
 import sys
-import subprocess
 import json
 import locale
 from pathlib import Path
 
+from ffmpeg_engine import get_engine, progress_line_handler
+from resource_governor import configure_from_argv
+from tracing import enable_from_argv, is_enabled, span
+
 # 设置控制台编码
 if sys.platform == 'win32':
     try:
@@ -25,10 +30,24 @@ if sys.platform == 'win32':
         pass
 
 
-def run_ffmpeg_command(cmd):
+PROBE_TIMEOUT = 120
+VIDEO_EXTENSIONS = {'.mkv', '.mp4', '.avi', '.mov', '.flv', '.wmv', '.m4v', '.ts', '.webm'}
+
+
+def _size_or_none(path):
+    """File size for trace attributes; a missing input is reported by ffmpeg, not here"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def run_ffmpeg_command(cmd, timeout=None, on_stdout_line=None):
     """Run ffmpeg command and return result"""
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8')
+        result = get_engine().run(cmd, timeout=timeout, on_stdout_line=on_stdout_line)
+        if result.timed_out:
+            return False, result.stdout, f"Timed out after {timeout}s"
         return result.returncode == 0, result.stdout, result.stderr
     except Exception as e:
         return False, "", str(e)
@@ -45,13 +64,15 @@ def get_video_info(file_path):
         str(file_path)
     ]
 
-    success, stdout, stderr = run_ffmpeg_command(cmd)
+    with span('probe', 'media', path=str(file_path)):
+        success, stdout, stderr = run_ffmpeg_command(cmd, timeout=PROBE_TIMEOUT)
     if not success:
         print(f"Failed to get video info: {stderr}")
         return None
 
     try:
-        data = json.loads(stdout)
+        with span('parse_probe', 'media', bytes=len(stdout)):
+            data = json.loads(stdout)
         return data
     except json.JSONDecodeError:
         print("Failed to parse video info")
@@ -131,28 +152,207 @@ def select_tracks_to_keep(audio_tracks):
             print("Invalid input format, please try again")
 
 
-def remove_audio_tracks(input_file, output_file, tracks_to_keep, audio_tracks):
-    """Remove unwanted audio tracks"""
-    # Build ffmpeg command
-    cmd = ['ffmpeg', '-i', str(input_file), '-map', '0:v']  # Keep all video tracks
+def select_track_actions(audio_tracks, tracks_to_keep):
+    """Let user convert kept tracks, e.g. '2=aac:192k:2' (codec, bitrate, channels)"""
+    print("\nConvert kept tracks? Enter <no.>=<codec>[:<bitrate>][:<channels>], separated by commas")
+    print(f"Codecs: {', '.join(TRANSCODE_CODECS)}. Example: 2=aac:192k:2 or 1=opus. Press Enter to copy all")
+
+    while True:
+        choice = input("Convert: ").strip()
+        if not choice:
+            return {}
+        try:
+            track_actions = {}
+            for item in choice.split(','):
+                number, separator, spec = item.partition('=')
+                track_index = int(number.strip()) - 1 if separator else -1
+                if track_index not in tracks_to_keep:
+                    raise ValueError(f"'{item.strip()}' is not a kept track")
+                track_actions[track_index] = parse_track_action(spec)
+            return track_actions
+        except ValueError as e:
+            print(f"{e}, please try again")
+
+
+def track_layout_signature(audio_tracks):
+    """Files with the same signature (codec, language, title, channels per track) can share one selection"""
+    return tuple((track['codec'], track['language'], track['title'], track['channels']) for track in audio_tracks)
+
+
+def describe_layout(signature):
+    """One-line summary of a track layout, e.g. 'jpn aac 2ch | eng dts 6ch "Commentary"'"""
+    parts = []
+    for codec, language, title, channels in signature:
+        part = f"{language} {codec} {channels}ch"
+        if title:
+            part += f' "{title}"'
+        parts.append(part)
+    return ' | '.join(parts)
+
+
+def select_tracks_by_policy(audio_tracks, keep_languages=None, drop_title_patterns=None):
+    """Pick tracks to keep by language, dropping any whose title matches a pattern (case-insensitive)"""
+    keep_languages = [lang.lower() for lang in keep_languages or []]
+    drop_title_patterns = [pattern.lower() for pattern in drop_title_patterns or []]
+
+    tracks_to_keep = []
+    for i, track in enumerate(audio_tracks):
+        if keep_languages and track['language'].lower() not in keep_languages:
+            continue
+        title = (track['title'] or '').lower()
+        if any(pattern in title for pattern in drop_title_patterns):
+            continue
+        tracks_to_keep.append(i)
+    return tracks_to_keep
+
+
+# 转码时可选的音频编码器和默认码率
+TRANSCODE_CODECS = {'aac': 'aac', 'opus': 'libopus', 'ac3': 'ac3', 'eac3': 'eac3', 'flac': 'flac'}
+DEFAULT_BITRATES = {'aac': 96, 'opus': 64, 'ac3': 96, 'eac3': 80}  # kbps per channel
+
+
+def parse_track_action(spec):
+    """Parse 'copy' or '<codec>[:<bitrate>][:<channels>]' (e.g. aac:192k:2) into a transcode dict or None"""
+    spec = spec.strip().lower()
+    if spec in ('', 'copy', 'keep'):
+        return None
+    codec, _, rest = spec.partition(':')
+    bitrate, _, channels = rest.partition(':')
+    if codec not in TRANSCODE_CODECS:
+        raise ValueError(f"Unknown codec '{codec}' (choose from {', '.join(TRANSCODE_CODECS)})")
+    # Require the unit: a bare 192000 is ambiguous between bit/s and kbit/s
+    if bitrate and not (bitrate.endswith('k') and bitrate[:-1].isdigit()):
+        raise ValueError(f"Invalid bitrate '{bitrate}', give it in kbit/s with a k suffix, e.g. 192k")
+    if channels and not channels.isdigit():
+        raise ValueError(f"Invalid channel count '{channels}', e.g. 2")
+    return {'codec': codec, 'bitrate': bitrate or None, 'channels': int(channels) if channels else None}
+
+
+# GUI右键菜单中的转码预设
+TRACK_ACTION_PRESETS = [
+    ("Copy (keep as-is)", 'copy'),
+    ("AAC stereo 192k", 'aac:192k:2'),
+    ("AAC 5.1 384k", 'aac:384k:6'),
+    ("Opus stereo 128k", 'opus:128k:2'),
+    ("Opus 5.1 256k", 'opus:256k:6'),
+    ("AC3 5.1 448k", 'ac3:448k:6'),
+]
+
+
+def format_track_action(action):
+    """Short label for a transcode dict, e.g. 'AAC 192k 2ch'"""
+    if action is None:
+        return "Copy"
+    label = action['codec'].upper()
+    if action['bitrate']:
+        label += f" {action['bitrate']}"
+    if action['channels']:
+        label += f" {action['channels']}ch"
+    return label
+
+
+def _encode_args(output_index, track, action):
+    """Encoder options for output audio stream output_index"""
+    channels = action['channels'] or (track['channels'] if track['channels'] != 'unknown' else 2)
+    bitrate = action['bitrate']
+    if not bitrate and action['codec'] in DEFAULT_BITRATES:
+        bitrate = f"{DEFAULT_BITRATES[action['codec']] * int(channels)}k"
+    args = [f'-c:a:{output_index}', TRANSCODE_CODECS[action['codec']]]
+    if bitrate:
+        args += [f'-b:a:{output_index}', bitrate]
+    if action['channels']:
+        args += [f'-ac:a:{output_index}', str(action['channels'])]
+    return args
+
+
+def _keep_map_args(tracks_to_keep, audio_tracks, track_actions=None):
+    """ffmpeg -map/-c arguments for a cleaned output, or None if an index is invalid
+
+    track_actions maps a track index to a transcode dict (see parse_track_action); other tracks are copied.
+    """
+    track_actions = track_actions or {}
+    map_args = ['-map', '0:v']  # Keep all video tracks
 
     # Add audio tracks to keep
     for i in tracks_to_keep:
         if i < 0 or i >= len(audio_tracks):
             error_msg = f"Error: Invalid track index {i} (valid range: 0-{len(audio_tracks)-1})"
             print(error_msg)
-            return False
+            return None
 
         track = audio_tracks[i]
         stream_index = track['stream_index']
-        cmd.extend(['-map', f'0:{stream_index}'])
+        map_args.extend(['-map', f'0:{stream_index}'])
 
     # Copy all subtitle tracks (if any)
-    cmd.extend(['-map', '0:s?', '-c', 'copy', str(output_file)])
+    map_args.extend(['-map', '0:s?', '-c', 'copy'])
+
+    # Stream-specific options override the copy for the tracks being converted.
+    # The engine's resource governor sets -threads for encoding commands.
+    for output_index, i in enumerate(tracks_to_keep):
+        if track_actions.get(i):
+            map_args.extend(_encode_args(output_index, audio_tracks[i], track_actions[i]))
+    return map_args
+
+
+def _mp4_args(mp4_layout, output_file, video_info, tracks_to_keep, audio_tracks):
+    """Faststart/fragmented muxer options for an MP4 output (see mp4_layout.py)"""
+    if not mp4_layout:
+        return []
+    from mp4_layout import output_args
+
+    stream_indices = None
+    if video_info:
+        # Size the reserved moov for the streams actually written
+        kept = {audio_tracks[i]['stream_index'] for i in tracks_to_keep if 0 <= i < len(audio_tracks)}
+        stream_indices = {stream.get('index') for stream in video_info.get('streams', [])
+                          if stream.get('codec_type') in ('video', 'subtitle') or stream.get('index') in kept}
+    return output_args(mp4_layout, output_file, video_info, stream_indices=stream_indices)
+
+
+def _run_mp4_aware(cmd, on_stdout_line):
+    """Run an ffmpeg command, retrying with +faststart if a reserved moov turned out too small"""
+    success, stdout, stderr = run_ffmpeg_command(cmd, on_stdout_line=on_stdout_line)
+    if not success and '-moov_size' in cmd:
+        from mp4_layout import reserved_space_too_small, with_faststart_fallback
+        if reserved_space_too_small(stderr):
+            print("Reserved moov space too small, retrying with +faststart")
+            success, stdout, stderr = run_ffmpeg_command(with_faststart_fallback(cmd), on_stdout_line=on_stdout_line)
+    return success, stdout, stderr
+
+
+def remove_audio_tracks(input_file, output_file, tracks_to_keep, audio_tracks, progress=None, duration=None,
+                        track_actions=None, mp4_layout=None, video_info=None):
+    """Remove unwanted audio tracks
+
+    track_actions converts kept tracks in the same pass (index -> parse_track_action() dict).
+    progress, if given, is called with the completed fraction (0-1) of duration seconds.
+    mp4_layout ('faststart' or 'fragmented') applies to MP4/MOV outputs; video_info sizes the moov.
+    """
+    # Build ffmpeg command
+    with span('build_map', 'media', tracks=len(tracks_to_keep)):
+        # Overwriting was already confirmed by the caller, and ffmpeg has no terminal to ask on
+        cmd = ['ffmpeg', '-y', '-i', str(input_file)]
+        map_args = _keep_map_args(tracks_to_keep, audio_tracks, track_actions)
+        if map_args is None:
+            return False
+        cmd.extend(map_args)
+
+        on_stdout_line = None
+        if progress is not None:
+            cmd.extend(['-progress', 'pipe:1', '-nostats'])
+            on_stdout_line = progress_line_handler(duration, progress)
+        cmd.extend(_mp4_args(mp4_layout, output_file, video_info, tracks_to_keep, audio_tracks))
+        cmd.append(str(output_file))
 
     print("Running command:", ' '.join(cmd))
 
-    success, stdout, stderr = run_ffmpeg_command(cmd)
+    with span('remux', 'media', input=str(input_file)) as remux_span:
+        if is_enabled():
+            remux_span.set('input_bytes', _size_or_none(input_file))
+        success, stdout, stderr = _run_mp4_aware(cmd, on_stdout_line)
+        if success and is_enabled():
+            remux_span.set('output_bytes', os.path.getsize(output_file))
     if success:
         print(f"Processing completed! Output file: {output_file}")
         return True
@@ -161,7 +361,216 @@ def remove_audio_tracks(input_file, output_file, tracks_to_keep, audio_tracks):
         return False
 
 
-def process_video_file(file_path):
+# 按编码选择能直接封装该音频流的文件扩展名，其余放进MKA
+AUDIO_EXTENSIONS = {
+    'aac': '.m4a', 'alac': '.m4a', 'mp3': '.mp3', 'ac3': '.ac3', 'eac3': '.eac3',
+    'dts': '.dts', 'flac': '.flac', 'opus': '.opus', 'vorbis': '.ogg',
+}
+
+
+def audio_track_path(input_file, track_no, track, output_dir=None):
+    """<stem>.track<N>.<language>.<ext> next to the input (or in output_dir); N is 1-based"""
+    input_file = Path(input_file)
+    extension = AUDIO_EXTENSIONS.get(track['codec'], '.mka')
+    directory = Path(output_dir) if output_dir else input_file.parent
+    return directory / f"{input_file.stem}.track{track_no + 1}.{track['language']}{extension}"
+
+
+def extract_audio_tracks(input_file, audio_tracks, tracks_to_extract, output_dir=None,
+                         cleaned_output=None, tracks_to_keep=None, progress=None, duration=None,
+                         track_actions=None, mp4_layout=None, video_info=None):
+    """Write each selected audio track to its own file in one ffmpeg pass over the input
+
+    With cleaned_output, the same pass also writes the video keeping only tracks_to_keep.
+    Returns the list of written audio files, or None on failure.
+    """
+    with span('build_map', 'media', tracks=len(tracks_to_extract)):
+        cmd = ['ffmpeg', '-y', '-i', str(input_file)]
+        on_stdout_line = None
+        if progress is not None:
+            cmd.extend(['-progress', 'pipe:1', '-nostats'])
+            on_stdout_line = progress_line_handler(duration, progress)
+
+        # Every output takes its own -map/-c options, so one read of the container feeds all of them
+        if cleaned_output is not None:
+            map_args = _keep_map_args(tracks_to_keep or [], audio_tracks, track_actions)
+            if map_args is None:
+                return None
+            cmd.extend(map_args)
+            cmd.extend(_mp4_args(mp4_layout, cleaned_output, video_info, tracks_to_keep or [], audio_tracks))
+            cmd.append(str(cleaned_output))
+
+        output_files = []
+        for i in tracks_to_extract:
+            if i < 0 or i >= len(audio_tracks):
+                print(f"Error: Invalid track index {i} (valid range: 0-{len(audio_tracks)-1})")
+                return None
+            output_file = audio_track_path(input_file, i, audio_tracks[i], output_dir)
+            cmd.extend(['-map', f"0:{audio_tracks[i]['stream_index']}", '-c', 'copy', str(output_file)])
+            output_files.append(output_file)
+
+    print("Running command:", ' '.join(cmd))
+
+    with span('extract', 'media', input=str(input_file),
+              outputs=len(output_files) + (cleaned_output is not None)) as extract_span:
+        if is_enabled():
+            extract_span.set('input_bytes', _size_or_none(input_file))
+        success, stdout, stderr = _run_mp4_aware(cmd, on_stdout_line)
+    if not success:
+        print(f"Extraction failed: {stderr}")
+        return None
+
+    for output_file in output_files:
+        print(f"Extracted: {output_file}")
+    if cleaned_output is not None:
+        print(f"Processing completed! Output file: {cleaned_output}")
+    return output_files
+
+
+def verify_output(output_file, input_info, expected_audio_tracks):
+    """Probe a finished output; returns a problem description, or None if it looks complete"""
+    output_info = get_video_info(output_file)
+    if not output_info:
+        return "cannot read the output"
+
+    def count(info, codec_type):
+        return sum(1 for stream in info.get('streams', []) if stream.get('codec_type') == codec_type)
+
+    if count(output_info, 'video') != count(input_info, 'video'):
+        return f"expected {count(input_info, 'video')} video stream(s), found {count(output_info, 'video')}"
+    if count(output_info, 'audio') != expected_audio_tracks:
+        return f"expected {expected_audio_tracks} audio track(s), found {count(output_info, 'audio')}"
+    input_duration = float(input_info.get('format', {}).get('duration') or 0)
+    output_duration = float(output_info.get('format', {}).get('duration') or 0)
+    if abs(input_duration - output_duration) > max(1.0, input_duration * 0.01):
+        return f"duration {output_duration:.1f}s does not match the input's {input_duration:.1f}s"
+    return None
+
+
+def remux_and_publish(input_file, output_file, tracks_to_keep, audio_tracks, video_info, track_actions=None,
+                      staging_dir=None, replace_input=False, extract_tracks=None, progress=None, mp4_layout=None,
+                      extract_dir=None):
+    """Write the cleaned video to a temporary file, verify it, then atomically move it into place
+
+    The temporary file lives in staging_dir (e.g. a scratch SSD) or next to the final file, and free
+    space is checked against the estimated size first. With replace_input the verified result replaces
+    input_file instead of being written to output_file. extract_tracks are also saved as audio files
+    in the same pass, next to the input or in extract_dir. mp4_layout ('faststart'/'fragmented') applies
+    to MP4/MOV outputs.
+    Returns the final path, or None on failure.
+    """
+    from remux_planner import estimate_output_bytes
+    from staged_output import (InsufficientSpaceError, clean_stale_partials, discard, ensure_free_space, publish,
+                               staging_path_for)
+
+    input_file = Path(input_file)
+    final_path = input_file if replace_input else Path(output_file)
+    # Leftovers of crashed runs would otherwise count against the free space checked below
+    clean_stale_partials(staging_dir, final_path.parent)
+    staged_path = staging_path_for(final_path, staging_dir)
+
+    estimated_bytes, _, method = estimate_output_bytes(input_file, video_info, tracks_to_keep, track_actions,
+                                                       scan_packets=False)
+    if method == 'incomplete':
+        # Some stream sizes are unknown; a remux is rarely larger than its input
+        estimated_bytes = max(estimated_bytes, input_file.stat().st_size)
+    try:
+        ensure_free_space(estimated_bytes, final_path.parent, staging_dir)
+    except InsufficientSpaceError as e:
+        print(f"Error: {e}")
+        return None
+
+    duration = float(video_info.get('format', {}).get('duration') or 0)
+    try:
+        if extract_tracks:
+            success = extract_audio_tracks(input_file, audio_tracks, extract_tracks, extract_dir, staged_path,
+                                           tracks_to_keep=tracks_to_keep, progress=progress, duration=duration,
+                                           track_actions=track_actions, mp4_layout=mp4_layout,
+                                           video_info=video_info) is not None
+        else:
+            success = remove_audio_tracks(input_file, staged_path, tracks_to_keep, audio_tracks,
+                                          progress=progress, duration=duration, track_actions=track_actions,
+                                          mp4_layout=mp4_layout, video_info=video_info)
+        if not success:
+            return None
+
+        with span('verify', 'media', path=str(staged_path)):
+            problem = verify_output(staged_path, video_info, len(tracks_to_keep))
+        if problem:
+            print(f"Verification failed, output discarded: {problem}")
+            return None
+        publish(staged_path, final_path)
+    finally:
+        discard(staged_path)
+
+    print(f"Saved: {final_path}")
+    return final_path
+
+
+def parse_transcode_rules(text):
+    """Parse 'dts=aac:192k:2,truehd=opus' into {source codec: transcode dict}"""
+    rules = {}
+    for rule in text.split(','):
+        if not rule.strip():
+            continue
+        source_codec, separator, spec = rule.partition('=')
+        if not separator:
+            raise ValueError(f"Invalid rule '{rule}', expected <source codec>=<codec>[:<bitrate>][:<channels>]")
+        rules[source_codec.strip().lower()] = parse_track_action(spec)
+    return rules
+
+
+def actions_from_rules(audio_tracks, tracks_to_keep, transcode_rules):
+    """Per-track actions for the kept tracks whose source codec has a rule"""
+    return {i: transcode_rules[audio_tracks[i]['codec'].lower()] for i in tracks_to_keep
+            if transcode_rules.get(audio_tracks[i]['codec'].lower())}
+
+
+def process_with_policy(file_path, output_file, keep_languages, drop_title_patterns, transcode_rules=None,
+                        staging_dir=None, replace_input=False, mp4_layout=None):
+    """Apply the track-keep policy to one file
+
+    Returns True if an output was written, False on failure and None if the file needs no change.
+    """
+    video_info = get_video_info(file_path)
+    if not video_info:
+        return False
+    audio_tracks = list_audio_tracks(video_info)
+    if not audio_tracks:
+        print(f"No audio tracks found, skipping: {file_path}")
+        return None
+
+    tracks_to_keep = select_tracks_by_policy(audio_tracks, keep_languages, drop_title_patterns)
+    if not tracks_to_keep:
+        print(f"No audio track matches the policy, skipping: {file_path}")
+        return False
+    track_actions = actions_from_rules(audio_tracks, tracks_to_keep, transcode_rules or {})
+    if len(tracks_to_keep) == len(audio_tracks) and not track_actions:
+        print(f"All tracks match the policy, nothing to remove: {file_path}")
+        return None
+
+    return remux_and_publish(file_path, output_file, tracks_to_keep, audio_tracks, video_info, track_actions,
+                             staging_dir, replace_input, mp4_layout=mp4_layout) is not None
+
+
+def show_plan(file_path, output_file, tracks_to_keep, track_actions, video_info):
+    """Print the estimated output size and time; returns False if the output will not fit"""
+    from remux_planner import check_free_space, format_bytes, format_duration, plan_file
+
+    try:
+        plan = plan_file(file_path, output_file, tracks_to_keep, track_actions, video_info, scan_packets=False)
+    except Exception as e:
+        print(f"Could not estimate the output: {e}")
+        return True
+    print(f"\nEstimated output: {format_bytes(plan['output_bytes'])} "
+          f"(input {format_bytes(plan['input_bytes'])}), about {format_duration(plan['seconds'])}")
+    for directory, needed, free in check_free_space([plan]):
+        print(f"Not enough free space in {directory}: needs {format_bytes(needed)}, {format_bytes(free)} free")
+        return False
+    return True
+
+
+def process_video_file(file_path, output_dir=None, staging_dir=None, replace_input=False, mp4_layout=None):
     """Process single video file"""
     if not file_path.exists():
         print(f"File not found: {file_path}")
@@ -193,25 +602,35 @@ def process_video_file(file_path):
     # Generate output filename
     stem = file_path.stem
     suffix = file_path.suffix
-    output_file = file_path.parent / f"{stem}_cleaned{suffix}"
+    output_file = file_path if replace_input else Path(output_dir or file_path.parent) / f"{stem}_cleaned{suffix}"
 
     # If output file exists, ask for confirmation
-    if output_file.exists():
+    if output_file.exists() and not replace_input:
         choice = input(f"Output file already exists: {output_file}\nOverwrite? (y/n): ").strip().lower()
         if choice != 'y':
             print("Processing cancelled")
             return
 
+    track_actions = select_track_actions(audio_tracks, tracks_to_keep)
+
+    from staged_output import staging_path_for
+    if not show_plan(file_path, staging_path_for(output_file, staging_dir), tracks_to_keep, track_actions, video_info):
+        choice = input("Continue anyway? (y/n): ").strip().lower()
+        if choice != 'y':
+            print("Processing cancelled")
+            return
+
     # Remove unwanted audio tracks
     print(f"\nKeeping tracks: {[i+1 for i in tracks_to_keep]}")
-    success = remove_audio_tracks(file_path, output_file, tracks_to_keep, audio_tracks)
+    input_size = file_path.stat().st_size
+    success = remux_and_publish(file_path, output_file, tracks_to_keep, audio_tracks, video_info, track_actions,
+                                staging_dir, replace_input, mp4_layout=mp4_layout)
 
     if success:
         # 显示文件大小对比
-        input_size = file_path.stat().st_size
         output_size = output_file.stat().st_size
-        print(".1f")
-        print(".1f")
+        print(f"Original size: {input_size / 1024 / 1024:.1f} MB")
+        print(f"New size: {output_size / 1024 / 1024:.1f} MB (saved {(input_size - output_size) / 1024 / 1024:.1f} MB)")
 
 
 def check_dependencies():
@@ -237,6 +656,7 @@ try:
     import tkinter as tk
     from tkinter import filedialog, messagebox, ttk, scrolledtext
     import threading
+    from concurrent.futures import ThreadPoolExecutor
     GUI_AVAILABLE = True
 except ImportError:
     GUI_AVAILABLE = False
@@ -246,15 +666,21 @@ class AudioTrackRemoverGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Audio Track Remover v1.0")
-        self.root.geometry("800x600")
+        self.root.geometry("800x860")
         self.root.resizable(True, True)
 
         # 变量
         self.input_file = None
         self.audio_tracks = []
         self.selected_tracks = []
+        self.track_actions = {}
         self.processing = False
 
+        # 队列：按音轨布局分组，每组只需选择一次
+        self.queue_groups = {}
+        self.current_group = None
+        self.probe_executor = ThreadPoolExecutor(max_workers=4)
+
         self.setup_ui()
 
     def setup_ui(self):
@@ -271,12 +697,35 @@ class AudioTrackRemoverGUI:
         ttk.Entry(file_frame, textvariable=self.file_path_var, state='readonly').pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
         ttk.Button(file_frame, text="Browse...", command=self.select_file).pack(side=tk.RIGHT)
 
+        # 批量队列区域：相同音轨布局的文件归为一组
+        queue_frame = ttk.LabelFrame(main_frame, text="Queue - Files with the same track layout share one selection",
+                                     padding="5")
+        queue_frame.pack(fill=tk.X, pady=(0, 10))
+
+        self.queue_tree = ttk.Treeview(queue_frame, columns=("Files", "Layout"), show="tree headings", height=5)
+        self.queue_tree.heading("#0", text="Group")
+        self.queue_tree.heading("Files", text="Files")
+        self.queue_tree.heading("Layout", text="Audio layout")
+        self.queue_tree.column("#0", width=160)
+        self.queue_tree.column("Files", width=50, anchor="center")
+        self.queue_tree.column("Layout", width=500)
+        self.queue_tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.queue_tree.bind('<<TreeviewSelect>>', self.on_group_select)
+
+        queue_buttons = ttk.Frame(queue_frame)
+        queue_buttons.pack(side=tk.RIGHT, fill=tk.Y, padx=(5, 0))
+        ttk.Button(queue_buttons, text="Add Files...", command=self.add_queue_files).pack(fill=tk.X)
+        ttk.Button(queue_buttons, text="Clear", command=self.clear_queue).pack(fill=tk.X, pady=5)
+        self.process_queue_btn = ttk.Button(queue_buttons, text="Process Queue", command=self.process_queue,
+                                            state=tk.DISABLED)
+        self.process_queue_btn.pack(fill=tk.X)
+
         # 音轨信息区域
         tracks_frame = ttk.LabelFrame(main_frame, text="Audio Tracks - Click any row to toggle Keep/Delete", padding="5")
         tracks_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
 
         # 创建Treeview来显示音轨
-        columns = ("No.", "Language", "Title", "Channels", "Sample Rate", "Bitrate", "Codec", "Keep?")
+        columns = ("No.", "Language", "Title", "Channels", "Sample Rate", "Bitrate", "Codec", "Keep?", "Action")
         self.tracks_tree = ttk.Treeview(tracks_frame, columns=columns, show="headings", height=8)
 
         # 设置列标题和宽度
@@ -288,7 +737,8 @@ class AudioTrackRemoverGUI:
             "Sample Rate": 90,
             "Bitrate": 80,
             "Codec": 80,
-            "Keep?": 60
+            "Keep?": 60,
+            "Action": 110
         }
         
         for col in columns:
@@ -307,9 +757,17 @@ class AudioTrackRemoverGUI:
         # 绑定选择事件 - 整行都可以点击
         self.tracks_tree.bind('<Button-1>', self.on_track_click)
         self.tracks_tree.bind('<Double-Button-1>', self.on_track_click)
+        # 右键菜单设置保留音轨的转码方式
+        self.tracks_tree.bind('<Button-3>', self.show_action_menu)
+        self.action_menu = tk.Menu(self.root, tearoff=0)
+        for label, spec in TRACK_ACTION_PRESETS:
+            self.action_menu.add_command(label=label, command=lambda spec=spec: self.set_track_action(spec))
+        self.action_menu.add_separator()
+        self.action_menu.add_command(label="Delete track", command=lambda: self.set_track_action(None))
+        self.action_item = None
         
         # 添加提示标签
-        hint_label = ttk.Label(tracks_frame, text="💡 Tip: Click on any row or the 'Keep?' column to toggle track selection", 
+        hint_label = ttk.Label(tracks_frame, text="💡 Tip: Click a row to toggle Keep/Delete, right-click to convert a kept track (one pass, video is copied)", 
                                font=('TkDefaultFont', 8), foreground='gray')
         hint_label.pack(side=tk.BOTTOM, pady=(5, 0))
 
@@ -326,6 +784,33 @@ class AudioTrackRemoverGUI:
         self.process_btn = ttk.Button(button_frame, text="Process & Remove Unselected Tracks", command=self.process_file, state=tk.DISABLED)
         self.process_btn.pack(side=tk.RIGHT)
 
+        # 删除的音轨可以在同一次处理中另存为音频文件
+        self.save_removed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="Save removed tracks as audio files",
+                        variable=self.save_removed_var).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # 输出位置：输出目录、暂存目录（如高速SSD）、验证后替换原文件
+        output_frame = ttk.LabelFrame(main_frame, text="Output", padding="5")
+        output_frame.pack(fill=tk.X, pady=(0, 10))
+        self.output_dir_var = tk.StringVar()
+        self.staging_dir_var = tk.StringVar()
+        for row, (label, variable) in enumerate((("Output folder:", self.output_dir_var),
+                                                 ("Staging folder:", self.staging_dir_var))):
+            ttk.Label(output_frame, text=label).grid(row=row, column=0, sticky=tk.W)
+            ttk.Entry(output_frame, textvariable=variable).grid(row=row, column=1, sticky=tk.EW, padx=5)
+            ttk.Button(output_frame, text="Browse...",
+                       command=lambda variable=variable: self.select_directory(variable)).grid(row=row, column=2)
+        output_frame.columnconfigure(1, weight=1)
+        self.replace_input_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(output_frame, text="Replace the original file after verification",
+                        variable=self.replace_input_var).grid(row=2, column=0, columnspan=2, sticky=tk.W)
+        # MP4输出：moov放在文件开头（faststart）或分片MP4，方便网页播放
+        mp4_frame = ttk.Frame(output_frame)
+        mp4_frame.grid(row=2, column=1, columnspan=2, sticky=tk.E)
+        ttk.Label(mp4_frame, text="MP4 layout:").pack(side=tk.LEFT)
+        self.mp4_layout_var = tk.StringVar(value='default')
+        ttk.OptionMenu(mp4_frame, self.mp4_layout_var, 'default', 'default', 'faststart', 'fragmented').pack(side=tk.LEFT)
+
         # 进度和状态区域
         status_frame = ttk.LabelFrame(main_frame, text="Status", padding="5")
         status_frame.pack(fill=tk.BOTH, expand=True)
@@ -344,7 +829,7 @@ class AudioTrackRemoverGUI:
 
     def check_dependencies(self):
         """检查依赖"""
-        success, _, _ = self.run_ffmpeg_command(['ffmpeg', '-version'])
+        success, _, _ = run_ffmpeg_command(['ffmpeg', '-version'])
         if not success:
             self.log_message("ERROR: FFmpeg not found. Please install FFmpeg first.")
             self.log_message("Download from: https://ffmpeg.org/download.html")
@@ -366,6 +851,8 @@ class AudioTrackRemoverGUI:
         )
 
         if filename:
+            self.store_group_selection()
+            self.current_group = None
             self.input_file = Path(filename)
             self.file_path_var.set(str(self.input_file))
             self.log_message(f"Selected file: {self.input_file}")
@@ -376,12 +863,19 @@ class AudioTrackRemoverGUI:
             # 自动开始分析
             self.analyze_file()
 
+    def select_directory(self, variable):
+        """选择目录（留空表示与输入文件相同）"""
+        directory = filedialog.askdirectory(title="Select folder")
+        if directory:
+            variable.set(directory)
+
     def clear_tracks(self):
         """清空音轨显示"""
         for item in self.tracks_tree.get_children():
             self.tracks_tree.delete(item)
         self.audio_tracks = []
         self.selected_tracks = []
+        self.track_actions = {}
         self.select_all_btn.config(state=tk.DISABLED)
         self.select_none_btn.config(state=tk.DISABLED)
         self.process_btn.config(state=tk.DISABLED)
@@ -402,13 +896,13 @@ class AudioTrackRemoverGUI:
         """分析文件的后台线程"""
         try:
             # 获取视频信息
-            video_info = self.get_video_info(self.input_file)
+            video_info = get_video_info(self.input_file)
             if not video_info:
                 self.root.after(0, lambda: self.log_message("Failed to analyze file"))
                 return
 
             # 列出音轨
-            audio_tracks = self.list_audio_tracks(video_info)
+            audio_tracks = list_audio_tracks(video_info)
             if not audio_tracks:
                 self.root.after(0, lambda: self.log_message("No audio tracks found in this file"))
                 return
@@ -435,6 +929,7 @@ class AudioTrackRemoverGUI:
         for item in self.tracks_tree.get_children():
             self.tracks_tree.delete(item)
         self.selected_tracks = []
+        self.track_actions = {}
         
         # 保存音轨数据（不清空self.audio_tracks，而是更新它）
         self.audio_tracks = audio_tracks
@@ -453,7 +948,8 @@ class AudioTrackRemoverGUI:
                 track['sample_rate'],
                 bitrate,
                 track['codec'],
-                "✓ Keep"  # 默认选择，显示为"✓ Keep"
+                "✓ Keep",  # 默认选择，显示为"✓ Keep"
+                format_track_action(None)
             )
 
             item = self.tracks_tree.insert("", tk.END, values=values, tags=('selected',))
@@ -520,6 +1016,34 @@ class AudioTrackRemoverGUI:
 
         self.update_process_button()
 
+    def show_action_menu(self, event):
+        """右键弹出转码菜单"""
+        item = self.tracks_tree.identify_row(event.y)
+        if item:
+            self.action_item = item
+            self.action_menu.tk_popup(event.x_root, event.y_root)
+
+    def set_track_action(self, spec):
+        """设置音轨动作：复制、转码/缩混或删除（spec为None）"""
+        item = self.action_item
+        values = list(self.tracks_tree.item(item, 'values'))
+        track_no = int(values[0]) - 1
+        if spec is None:
+            if track_no in self.selected_tracks:
+                self.toggle_track_selection(item)
+            return
+
+        action = parse_track_action(spec)
+        if action:
+            self.track_actions[track_no] = action
+        else:
+            self.track_actions.pop(track_no, None)
+        if track_no not in self.selected_tracks:
+            self.toggle_track_selection(item)
+            values = list(self.tracks_tree.item(item, 'values'))
+        values[8] = format_track_action(action)
+        self.tracks_tree.item(item, values=values)
+
     def update_process_button(self):
         """更新处理按钮状态"""
         if self.selected_tracks:
@@ -547,10 +1071,22 @@ class AudioTrackRemoverGUI:
         # 生成输出文件名
         stem = self.input_file.stem
         suffix = self.input_file.suffix
-        output_file = self.input_file.parent / f"{stem}_cleaned{suffix}"
+        output_dir = Path(self.output_dir_var.get().strip() or self.input_file.parent)
+        staging_dir = self.staging_dir_var.get().strip() or None
+        for directory in filter(None, (output_dir, staging_dir)):
+            if not Path(directory).is_dir():
+                messagebox.showerror("Error", f"Folder not found:\n{directory}")
+                return
+        if self.replace_input_var.get():
+            output_file = self.input_file
+            if not messagebox.askyesno("Replace original",
+                                       f"Replace the original file once the output is verified?\n{output_file}"):
+                return
+        else:
+            output_file = output_dir / f"{stem}_cleaned{suffix}"
 
         # 检查输出文件是否存在
-        if output_file.exists():
+        if output_file.exists() and not self.replace_input_var.get():
             result = messagebox.askyesno("File exists",
                                        f"Output file already exists:\n{output_file}\n\nOverwrite?")
             if not result:
@@ -564,30 +1100,64 @@ class AudioTrackRemoverGUI:
         self.log_message(f"  - Total tracks: {total_tracks}")
         self.log_message(f"  - Keeping: {tracks_to_keep} track(s)")
         self.log_message(f"  - Deleting: {tracks_to_delete} track(s)")
+        for i in sorted(i for i in self.track_actions if i in self.selected_tracks):
+            self.log_message(f"  - Converting track {i + 1} to {format_track_action(self.track_actions[i])}")
         
         self.process_btn.config(state=tk.DISABLED)
         self.progress_var.set(20)
 
         # 在后台线程中运行处理
         threading.Thread(target=self._process_file_thread,
-                        args=(output_file,),
+                        args=(output_file, staging_dir, self.replace_input_var.get()),
                         daemon=True).start()
 
-    def _process_file_thread(self, output_file):
+    def _process_file_thread(self, output_file, staging_dir=None, replace_input=False):
         """处理文件的后台线程"""
         try:
+            # 先预估输出大小和耗时，空间不足时不开始处理
+            from remux_planner import check_free_space, format_bytes, format_duration, plan_file
+            from staged_output import staging_path_for
+            # One probe serves the estimate and the remux; no packet scan before an interactive job
+            video_info = get_video_info(self.input_file)
+            try:
+                plan = plan_file(self.input_file, staging_path_for(output_file, staging_dir),
+                                 self.selected_tracks, self.track_actions, video_info, scan_packets=False)
+                estimate_msg = (f"Estimated output: {format_bytes(plan['output_bytes'])}, "
+                                f"about {format_duration(plan['seconds'])}")
+                self.root.after(0, lambda: self.log_message(estimate_msg))
+                shortfalls = check_free_space([plan])
+            except Exception as e:
+                self.root.after(0, lambda e=e: self.log_message(f"Could not estimate the output: {e}"))
+                shortfalls = []
+            if shortfalls:
+                directory, needed, free = shortfalls[0]
+                space_msg = f"Not enough free space in {directory}: needs {format_bytes(needed)}, {format_bytes(free)} free"
+                self.root.after(0, lambda: self.log_message(space_msg))
+                messagebox.showerror("Error", space_msg)
+                return
+
             self.root.after(0, lambda: self.progress_var.set(50))
 
-            success = self.remove_audio_tracks(self.input_file, output_file, self.selected_tracks, self.audio_tracks)
+            removed_tracks = [i for i in range(len(self.audio_tracks)) if i not in self.selected_tracks]
+            # 勾选时一次读取同时写出清理后的视频和被删除的音轨
+            extract_tracks = removed_tracks if self.save_removed_var.get() else None
+            input_size = self.input_file.stat().st_size
+            success = video_info is not None and remux_and_publish(
+                self.input_file, output_file, self.selected_tracks, self.audio_tracks, video_info,
+                self.track_actions, staging_dir, replace_input, extract_tracks,
+                mp4_layout=self.mp4_layout_var.get()) is not None
 
             if success:
+                for i in extract_tracks or []:
+                    path = audio_track_path(self.input_file, i, self.audio_tracks[i])
+                    self.root.after(0, lambda path=path: self.log_message(f"Saved removed track: {path}"))
                 self.root.after(0, lambda: self.progress_var.set(100))
                 self.root.after(0, lambda: self.log_message(f"Processing completed! Output file: {output_file}"))
 
                 # 显示文件大小对比
-                input_size = self.input_file.stat().st_size
                 output_size = output_file.stat().st_size
-                size_msg = ".1f"
+                size_msg = (f"Size: {input_size / 1024 / 1024:.1f} MB -> {output_size / 1024 / 1024:.1f} MB "
+                            f"(saved {(input_size - output_size) / 1024 / 1024:.1f} MB)")
                 self.root.after(0, lambda: self.log_message(size_msg))
 
                 messagebox.showinfo("Success", f"File processed successfully!\nSaved as: {output_file}")
@@ -603,79 +1173,191 @@ class AudioTrackRemoverGUI:
             self.root.after(0, lambda: self.process_btn.config(state=tk.NORMAL))
             self.root.after(0, lambda: self.progress_var.set(0))
 
-    def run_ffmpeg_command(self, cmd):
-        """Run ffmpeg command and return result"""
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8')
-            return result.returncode == 0, result.stdout, result.stderr
-        except Exception as e:
-            return False, "", str(e)
-
-    def get_video_info(self, file_path):
-        """Get video file information"""
-        cmd = [
-            'ffprobe',
-            '-v', 'quiet',
-            '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
-            str(file_path)
-        ]
+    def add_queue_files(self):
+        """添加文件到队列，在后台探测并按音轨布局分组"""
+        filenames = filedialog.askopenfilenames(
+            title="Select video files",
+            filetypes=[('Video files', ' '.join(f'*{ext}' for ext in sorted(VIDEO_EXTENSIONS))), ('All files', '*.*')]
+        )
+        queued = {path for group in self.queue_groups.values() for path, _ in group['files']}
+        new_files = [Path(name) for name in filenames if Path(name) not in queued]
+        if not new_files:
+            return
+        self.log_message(f"Analyzing {len(new_files)} file(s)...")
+        for file_path in new_files:
+            future = self.probe_executor.submit(get_video_info, file_path)
+            future.add_done_callback(
+                lambda future, file_path=file_path: self.root.after(0, self.on_queue_probe_done, file_path, future))
+
+    def on_queue_probe_done(self, file_path, future):
+        """探测完成后把文件加入对应的组（主线程）"""
+        video_info = future.result() if not future.exception() else None
+        audio_tracks = list_audio_tracks(video_info) if video_info else []
+        if not audio_tracks:
+            self.log_message(f"Skipped (no audio tracks or not readable): {file_path}")
+            return
 
-        success, stdout, stderr = self.run_ffmpeg_command(cmd)
-        if not success:
-            return None
+        signature = track_layout_signature(audio_tracks)
+        group = self.queue_groups.get(signature)
+        if group is None:
+            group = {
+                'item': self.queue_tree.insert("", tk.END, text=f"Layout {len(self.queue_groups) + 1}",
+                                               values=(0, describe_layout(signature)), open=False),
+                'audio_tracks': audio_tracks,
+                'selected': list(range(len(audio_tracks))),
+                'actions': {},
+                'files': [],
+            }
+            self.queue_groups[signature] = group
+        group['files'].append((file_path, video_info))
+        self.queue_tree.insert(group['item'], tk.END, text=file_path.name, values=("", str(file_path.parent)))
+        self.queue_tree.item(group['item'], values=(len(group['files']), describe_layout(signature)))
+        self.process_queue_btn.config(state=tk.NORMAL)
+
+    def on_group_select(self, event):
+        """选中一组（或组内文件）时显示该组的音轨，选择对整组生效"""
+        selection = self.queue_tree.selection()
+        if not selection:
+            return
+        item = selection[0]
+        item = self.queue_tree.parent(item) or item
+        signature = next((sig for sig, group in self.queue_groups.items() if group['item'] == item), None)
+        if signature is None or signature == self.current_group:
+            return
 
-        try:
-            data = json.loads(stdout)
-            return data
-        except json.JSONDecodeError:
-            return None
+        self.store_group_selection()
+        self.current_group = signature
+        group = self.queue_groups[signature]
+        self.input_file = group['files'][0][0]
+        self.file_path_var.set(f"{self.queue_tree.item(item, 'text')}: {len(group['files'])} file(s)")
+        self.display_tracks(group['audio_tracks'])
+        self.apply_selection(group['selected'], group['actions'])
+
+    def store_group_selection(self):
+        """把当前的保留/删除和转码选择保存到当前组"""
+        if self.current_group in self.queue_groups:
+            group = self.queue_groups[self.current_group]
+            group['selected'] = sorted(self.selected_tracks)
+            group['actions'] = dict(self.track_actions)
+
+    def apply_selection(self, selected, actions):
+        """在音轨列表中显示给定的选择"""
+        self.selected_tracks = list(selected)
+        self.track_actions = dict(actions)
+        for item in self.tracks_tree.get_children():
+            values = list(self.tracks_tree.item(item, 'values'))
+            track_no = int(values[0]) - 1
+            keep = track_no in self.selected_tracks
+            values[7] = "✓ Keep" if keep else "✗ Delete"
+            values[8] = format_track_action(self.track_actions.get(track_no))
+            self.tracks_tree.item(item, values=values, tags=('selected',) if keep else ())
+        self.update_process_button()
 
-    def list_audio_tracks(self, video_info):
-        """List all audio tracks in video file"""
-        streams = video_info.get('streams', [])
-        audio_tracks = []
-
-        for i, stream in enumerate(streams):
-            if stream.get('codec_type') == 'audio':
-                track_info = {
-                    'index': i,
-                    'stream_index': stream.get('index'),
-                    'codec': stream.get('codec_name', 'unknown'),
-                    'language': stream.get('tags', {}).get('language', 'und'),
-                    'title': stream.get('tags', {}).get('title', ''),
-                    'channels': stream.get('channels', 'unknown'),
-                    'sample_rate': stream.get('sample_rate', 'unknown'),
-                    'bitrate': stream.get('bit_rate', 'unknown')
-                }
-                audio_tracks.append(track_info)
-
-        return audio_tracks
-
-    def remove_audio_tracks(self, input_file, output_file, tracks_to_keep, audio_tracks):
-        """Remove unwanted audio tracks"""
-        # Build ffmpeg command
-        cmd = ['ffmpeg', '-i', str(input_file), '-map', '0:v']  # Keep all video tracks
-
-        # Add audio tracks to keep
-        for i in tracks_to_keep:
-            if i < 0 or i >= len(audio_tracks):
-                error_msg = f"Error: Invalid track index {i} (valid range: 0-{len(audio_tracks)-1})"
-                print(error_msg)
-                if hasattr(self, 'log_message'):
-                    self.log_message(error_msg)
-                return False
+    def clear_queue(self):
+        """清空队列"""
+        if self.processing:
+            return
+        self.queue_groups = {}
+        self.current_group = None
+        for item in self.queue_tree.get_children():
+            self.queue_tree.delete(item)
+        self.process_queue_btn.config(state=tk.DISABLED)
+
+    def process_queue(self):
+        """按每组的选择在后台处理队列中的所有文件"""
+        self.store_group_selection()
+        output_dir = self.output_dir_var.get().strip() or None
+        staging_dir = self.staging_dir_var.get().strip() or None
+        replace_input = self.replace_input_var.get()
+        for directory in filter(None, (output_dir, staging_dir)):
+            if not Path(directory).is_dir():
+                messagebox.showerror("Error", f"Folder not found:\n{directory}")
+                return
 
-            track = audio_tracks[i]
-            stream_index = track['stream_index']
-            cmd.extend(['-map', f'0:{stream_index}'])
+        jobs = []
+        skipped_groups = 0
+        unchanged_groups = 0
+        targets = set()
+        renamed = 0
+        for group in self.queue_groups.values():
+            if not group['selected']:
+                skipped_groups += 1
+                continue
+            if len(group['selected']) == len(group['audio_tracks']) and not group['actions']:
+                unchanged_groups += 1
+                continue
+            # Copies, so changing a selection while the queue runs does not affect it
+            selection = (list(group['selected']), dict(group['actions']))
+            for file_path, video_info in group['files']:
+                output_file = file_path if replace_input else \
+                    Path(output_dir or file_path.parent) / f"{file_path.stem}_cleaned{file_path.suffix}"
+                # Files from different folders can share a name in one output folder; number the later ones
+                n = 2
+                while not replace_input and output_file in targets:
+                    output_file = output_file.with_name(f"{file_path.stem}_cleaned_{n}{file_path.suffix}")
+                    n += 1
+                renamed += n > 2
+                targets.add(output_file)
+                jobs.append((file_path, output_file, video_info, selection))
+        if skipped_groups:
+            self.log_message(f"Skipping {skipped_groups} group(s) with no track kept")
+        if unchanged_groups:
+            self.log_message(f"Skipping {unchanged_groups} group(s) that keep every track unchanged")
+        if renamed:
+            self.log_message(f"{renamed} output(s) share a name with another queued file "
+                             f"and get a _cleaned_<n> suffix")
+        if not jobs:
+            messagebox.showinfo("Queue", "Nothing to do: every group keeps all tracks unchanged")
+            return
 
-        # Copy all subtitle tracks (if any)
-        cmd.extend(['-map', '0:s?', '-c', 'copy', str(output_file)])
+        existing = [output_file for _, output_file, _, _ in jobs if output_file.exists() and not replace_input]
+        if existing and not messagebox.askyesno("Files exist", f"{len(existing)} output file(s) already exist.\n\nOverwrite?"):
+            return
+        if replace_input and not messagebox.askyesno("Replace originals",
+                                                     f"Replace {len(jobs)} original file(s) once each output is verified?"):
+            return
 
-        success, stdout, stderr = self.run_ffmpeg_command(cmd)
-        return success
+        self.processing = True
+        self.process_queue_btn.config(state=tk.DISABLED)
+        self.process_btn.config(state=tk.DISABLED)
+        self.log_message(f"Processing {len(jobs)} file(s) from the queue...")
+        threading.Thread(target=self._process_queue_thread,
+                         args=(jobs, staging_dir, replace_input, self.save_removed_var.get(),
+                               self.mp4_layout_var.get()),
+                         daemon=True).start()
+
+    def _process_queue_thread(self, jobs, staging_dir, replace_input, save_removed, mp4_layout):
+        """队列处理的后台线程：逐个文件处理，避免多个文件争用同一块磁盘"""
+        failed = 0
+        try:
+            for n, (file_path, output_file, video_info, (selected, actions)) in enumerate(jobs):
+                def progress(fraction, n=n):
+                    self.root.after(0, lambda: self.progress_var.set((n + fraction) / len(jobs) * 100))
+
+                self.root.after(0, lambda file_path=file_path, n=n: self.log_message(
+                    f"[{n + 1}/{len(jobs)}] {file_path.name}"))
+                audio_tracks = list_audio_tracks(video_info)
+                removed_tracks = [i for i in range(len(audio_tracks)) if i not in selected]
+                try:
+                    result = remux_and_publish(file_path, output_file, selected, audio_tracks, video_info,
+                                               actions, staging_dir, replace_input,
+                                               removed_tracks if save_removed else None, progress, mp4_layout)
+                except Exception as e:
+                    print(f"Error processing {file_path}: {e}")
+                    result = None
+                if result is None:
+                    failed += 1
+                    self.root.after(0, lambda file_path=file_path: self.log_message(f"  Failed: {file_path.name}"))
+        finally:
+            summary = f"Queue finished: {len(jobs) - failed} done, {failed} failed"
+
+            def finish():
+                self.processing = False
+                self.progress_var.set(0)
+                self.process_queue_btn.config(state=tk.NORMAL)
+                self.update_process_button()
+                self.log_message(summary)
+            self.root.after(0, finish)
 
     def log_message(self, message):
         """记录消息到状态文本框"""
@@ -711,8 +1393,28 @@ def run_gui_mode(file_path=None):
     root.mainloop()
 
 
-def run_cli_mode(file_path):
+def read_file_list(args):
+    """Expand '-' into paths read from stdin, one per line"""
+    file_paths = []
+    for arg in args:
+        if arg == '-':
+            file_paths.extend(Path(line.strip()) for line in sys.stdin if line.strip())
+        else:
+            file_paths.append(Path(arg))
+    return file_paths
+
+
+def run_cli_mode(argv):
     """运行命令行模式"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='audio_track_remover.py --cli',
+                                     description='Remove audio tracks, choosing them interactively')
+    parser.add_argument('files', nargs='+', help="Video files, or '-' to read paths from stdin")
+    add_output_arguments(parser)
+    args = parser.parse_args(argv)
+    file_paths = read_file_list(args.files)
+
     print("Audio Track Remover Tool v1.0")
     print("=" * 40)
 
@@ -720,8 +1422,183 @@ def run_cli_mode(file_path):
     if not check_dependencies():
         sys.exit(1)
 
+    # 从标准输入读取文件列表后，交互输入需要改用终端
+    if not sys.stdin.isatty():
+        try:
+            sys.stdin = open('CON' if sys.platform == 'win32' else '/dev/tty', 'r')
+        except OSError:
+            pass
+
     # 处理文件
-    process_video_file(file_path)
+    for file_path in file_paths:
+        process_video_file(file_path, args.output_dir, args.staging_dir, args.in_place, args.mp4_layout)
+
+
+def add_output_arguments(parser):
+    """Output placement options shared by the CLI and batch modes"""
+    parser.add_argument('--output-dir', help='Write cleaned files here instead of next to the input')
+    parser.add_argument('--staging-dir',
+                        help='Write temporary files here (e.g. a scratch SSD) and move them into place when done')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Replace the input file once the output has been verified')
+    parser.add_argument('--mp4-layout', choices=('default', 'faststart', 'fragmented'), default='default',
+                        help='For MP4/MOV outputs: moov at the start (faststart) or fragmented MP4')
+
+
+def run_batch_mode(argv):
+    """批处理模式：按策略处理多个文件，通过日志支持断点续跑"""
+    import argparse
+    from job_journal import JOB_STATES, JobJournal, JournalLockedError
+
+    parser = argparse.ArgumentParser(prog='audio_track_remover.py --batch',
+                                     description='Remove audio tracks from many files without prompts')
+    parser.add_argument('files', nargs='+', help="Video files, or '-' to read paths from stdin")
+    parser.add_argument('--keep-lang', default='', help='Comma-separated languages to keep (e.g. jpn,eng)')
+    parser.add_argument('--drop-title', default='', help='Comma-separated title fragments to drop')
+    parser.add_argument('--transcode', default='',
+                        help='Convert kept tracks by source codec in the same pass, e.g. dts=aac:192k:2,truehd=opus')
+    add_output_arguments(parser)
+    parser.add_argument('--journal', default=str(Path.home() / '.cache' / 'audio_track_remover' / 'batch.journal'),
+                        help='Checkpoint journal; rerunning skips jobs already completed')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only estimate output sizes, time and free space; write nothing')
+    args = parser.parse_args(argv)
+
+    keep_languages = [lang.strip() for lang in args.keep_lang.split(',') if lang.strip()]
+    drop_title_patterns = [title.strip() for title in args.drop_title.split(',') if title.strip()]
+    try:
+        transcode_rules = parse_transcode_rules(args.transcode)
+    except ValueError as e:
+        parser.error(str(e))
+    if not keep_languages and not drop_title_patterns and not transcode_rules:
+        parser.error('a policy is required: --keep-lang, --drop-title and/or --transcode')
+
+    if not check_dependencies():
+        sys.exit(1)
+
+    if args.dry_run:
+        from remux_planner import plan_with_policy, print_plans
+        plans = plan_with_policy(read_file_list(args.files), keep_languages, drop_title_patterns,
+                                 transcode_rules, args.output_dir)
+        if plans and not print_plans(plans):
+            sys.exit(1)
+        return
+
+    # The journal deletes stale outputs before a rerun, which must never hit the input itself
+    try:
+        journal = None if args.in_place else JobJournal(args.journal)
+    except JournalLockedError as e:
+        parser.error(f"{e}; wait for it to finish or pass a different --journal")
+    params = {'keep_languages': keep_languages, 'drop_title_patterns': drop_title_patterns}
+    if transcode_rules:
+        params['transcode'] = transcode_rules
+    if args.mp4_layout != 'default':
+        params['mp4_layout'] = args.mp4_layout
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    for file_path in read_file_list(args.files):
+        if not file_path.exists():
+            print(f"File not found: {file_path}")
+            counts['failed'] += 1
+            continue
+        output_dir = Path(args.output_dir) if args.output_dir else file_path.parent
+        output_file = output_dir / f"{file_path.stem}_cleaned{file_path.suffix}"
+
+        def process():
+            return process_with_policy(file_path, output_file, keep_languages, drop_title_patterns,
+                                       transcode_rules, args.staging_dir, args.in_place, args.mp4_layout)
+
+        if journal is None:
+            state = JOB_STATES[process()]
+        else:
+            state = journal.run(file_path, output_file, params, process)
+        counts[state] += 1
+        print(f"[{state}] {file_path}")
+    if journal is not None:
+        journal.close()
+
+    print(f"\nBatch finished: {counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed")
+    if counts['failed']:
+        sys.exit(1)
+
+
+def run_extract_mode(argv):
+    """提取模式：一次读取视频，把音轨分别保存为独立文件"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='audio_track_remover.py --extract',
+                                     description='Save audio tracks as separate files in a single pass')
+    parser.add_argument('files', nargs='+', help="Video files, or '-' to read paths from stdin")
+    parser.add_argument('--tracks', default='', help='Comma-separated track numbers to extract (default: all)')
+    parser.add_argument('--keep-lang', default='', help='Extract the tracks this policy would remove (e.g. jpn,eng)')
+    parser.add_argument('--drop-title', default='', help='Comma-separated title fragments the policy drops')
+    parser.add_argument('--clean', action='store_true',
+                        help='Also write <name>_cleaned without the extracted tracks, in the same pass')
+    parser.add_argument('--output-dir',
+                        help='Write the audio files and the cleaned video here instead of next to the input')
+    parser.add_argument('--staging-dir',
+                        help='Write the cleaned video to this directory first, then move it into place')
+    parser.add_argument('--overwrite', action='store_true', help='Replace an existing cleaned video')
+    args = parser.parse_args(argv)
+
+    keep_languages = [lang.strip() for lang in args.keep_lang.split(',') if lang.strip()]
+    drop_title_patterns = [title.strip() for title in args.drop_title.split(',') if title.strip()]
+    try:
+        track_numbers = [int(n) - 1 for n in args.tracks.split(',') if n.strip()]
+    except ValueError:
+        parser.error('--tracks takes numbers separated by commas, e.g. 2,3')
+    if track_numbers and (keep_languages or drop_title_patterns):
+        parser.error('use either --tracks or a policy (--keep-lang/--drop-title), not both')
+
+    if not check_dependencies():
+        sys.exit(1)
+    for directory in filter(None, (args.output_dir, args.staging_dir)):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+
+    failed = 0
+    for file_path in read_file_list(args.files):
+        video_info = get_video_info(file_path) if file_path.exists() else None
+        audio_tracks = list_audio_tracks(video_info) if video_info else []
+        if not audio_tracks:
+            print(f"No audio tracks to extract: {file_path}")
+            failed += 1
+            continue
+
+        if keep_languages or drop_title_patterns:
+            kept = select_tracks_by_policy(audio_tracks, keep_languages, drop_title_patterns)
+            tracks_to_extract = [i for i in range(len(audio_tracks)) if i not in kept]
+        else:
+            tracks_to_extract = track_numbers or list(range(len(audio_tracks)))
+            kept = [i for i in range(len(audio_tracks)) if i not in tracks_to_extract]
+        if not tracks_to_extract:
+            print(f"Nothing to extract: {file_path}")
+            continue
+
+        cleaned_output = None
+        if args.clean:
+            if not kept:
+                print(f"No audio track would be left in the cleaned file, skipping: {file_path}")
+                failed += 1
+                continue
+            output_dir = Path(args.output_dir) if args.output_dir else file_path.parent
+            cleaned_output = output_dir / f"{file_path.stem}_cleaned{file_path.suffix}"
+            if cleaned_output.exists() and not args.overwrite:
+                print(f"Output file already exists, skipping: {cleaned_output} (use --overwrite to replace it)")
+                failed += 1
+                continue
+
+        print(f"\nExtracting tracks {[i + 1 for i in tracks_to_extract]} from {file_path}")
+        if cleaned_output is not None:
+            # The cleaned video is staged, verified and published like every other remux
+            written = remux_and_publish(file_path, cleaned_output, kept, audio_tracks, video_info,
+                                        staging_dir=args.staging_dir, extract_tracks=tracks_to_extract,
+                                        extract_dir=args.output_dir)
+        else:
+            written = extract_audio_tracks(file_path, audio_tracks, tracks_to_extract, args.output_dir)
+        if written is None:
+            failed += 1
+
+    if failed:
+        sys.exit(1)
 
 
 def show_help():
@@ -734,9 +1611,24 @@ def show_help():
     print("Usage:")
     print("  python audio_track_remover.py                # Start GUI mode (default)")
     print("  python audio_track_remover.py <video_file>   # Open file in GUI mode")
-    print("  python audio_track_remover.py --cli <file>    # Process file in CLI mode")
+    print("  python audio_track_remover.py --cli <file>... # Process file(s) in CLI mode")
+    print("  python audio_track_remover.py --cli -         # Process files listed on stdin")
+    print("      --output-dir <dir>   --staging-dir <dir>   --in-place   (CLI and batch modes)")
+    print("      --mp4-layout faststart|fragmented            # Web-friendly MP4 output")
+    print("                                               # Stage outputs on another disk, replace the input")
+    print("  python audio_track_remover.py --batch <file>... --keep-lang jpn,eng [--journal <path>]")
+    print("                                  [--transcode dts=aac:192k:2]  # Convert kept tracks in the same pass")
+    print("                                  [--dry-run]   # Estimate sizes, time and free space only")
+    print("                                               # Process many files, resumable after a crash")
+    print("  python audio_track_remover.py --extract <file>... [--tracks 2,3] [--clean]")
+    print("                                               # Save audio tracks as files in one pass")
+    print("  python audio_track_remover.py --watch <dir>... --keep-lang jpn,eng --drop-title commentary")
+    print("                                               # Watch folders and process new files")
     print("  python audio_track_remover.py --help          # Show this help")
     print()
+    print("Add --trace <prefix> to any mode to write a Chrome trace and JSON-lines metrics.")
+    print("Add --threads <n>, --io-tokens <n> per disk and --background (nice/ionice) to limit ffmpeg's load.")
+    print()
     print("Supported formats: MKV, MP4, AVI, MOV, FLV, WMV, etc.")
     print()
     print("Requirements:")
@@ -747,6 +1639,9 @@ def show_help():
 
 def main():
     """主函数"""
+    enable_from_argv(sys.argv)
+    configure_from_argv(sys.argv)
+
     # 检查是否有命令行参数
     if len(sys.argv) > 1:
         arg = sys.argv[1]
@@ -757,8 +1652,23 @@ def main():
         
         if arg == '--cli' and len(sys.argv) > 2:
             # 命令行模式（需要--cli参数）
-            file_path = Path(sys.argv[2])
-            run_cli_mode(file_path)
+            run_cli_mode(sys.argv[2:])
+            return
+
+        if arg == '--batch':
+            # 批处理模式（无交互，可断点续跑）
+            run_batch_mode(sys.argv[2:])
+            return
+
+        if arg == '--extract':
+            # 音轨提取模式
+            run_extract_mode(sys.argv[2:])
+            return
+
+        if arg == '--watch':
+            # 监视文件夹模式
+            from watch_folder import main as watch_main
+            watch_main(sys.argv[2:])
             return
         
         # 如果参数是文件路径，在GUI中打开
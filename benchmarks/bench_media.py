@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Media operations benchmark
+用lavfi生成固定的测试视频，测量探测、去音轨、剪切和重编码回退的性能
+
+Usage:
+  python benchmarks/bench_media.py                    # Run and compare with baseline_media.json
+  python benchmarks/bench_media.py --update-baseline  # Store this run as the baseline
+  python benchmarks/bench_media.py --quick            # Small fixtures only
+
+Exits with status 1 when a case is slower (or uses more memory) than the
+baseline by more than --threshold.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+from benchlib import add_common_arguments, finish, run_isolated
+from audio_track_remover import get_video_info, list_audio_tracks, remove_audio_tracks
+from video_cutter import cut_with_ffmpeg, cut_with_moviepy
+
+# name, size, duration (s), container, audio tracks
+FIXTURES = [
+    ("small_1a", "320x240", 10, "mkv", 1),
+    ("small_3a", "320x240", 10, "mp4", 3),
+    ("medium_3a", "1280x720", 30, "mkv", 3),
+    ("medium_6a", "1280x720", 30, "mp4", 6),
+    ("large_6a", "1920x1080", 60, "mkv", 6),
+]
+QUICK_FIXTURES = {"small_1a", "small_3a"}
+
+
+def generate_fixture(directory, name, size, duration, container, audio_tracks):
+    """Create a deterministic test file with ffmpeg lavfi sources (reused when it already exists)"""
+    path = os.path.join(directory, f"{name}.{container}")
+    if os.path.exists(path):
+        return path
+
+    cmd = ["ffmpeg", "-y", "-v", "error",
+           "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=25:duration={duration}"]
+    for track in range(audio_tracks):
+        cmd += ["-f", "lavfi", "-i", f"sine=frequency={220 * (track + 1)}:sample_rate=48000:duration={duration}"]
+    cmd += ["-map", "0:v"]
+    for track in range(audio_tracks):
+        cmd += ["-map", f"{track + 1}:a", f"-metadata:s:a:{track}", f"language={['jpn', 'eng', 'fra'][track % 3]}"]
+    cmd += ["-c:v", "libx264", "-preset", "ultrafast", "-threads", "1", "-c:a", "aac", "-b:a", "128k",
+            "-map_metadata", "-1", "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact",
+            path + ".tmp." + container]
+    subprocess.run(cmd, check=True)
+    os.replace(path + ".tmp." + container, path)
+    return path
+
+
+def case_probe(path):
+    if not get_video_info(path):
+        raise RuntimeError(f"ffprobe failed for {path}")
+    return {"input_bytes": os.path.getsize(path)}
+
+
+def case_remux(path, output_path):
+    audio_tracks = list_audio_tracks(get_video_info(path))
+    if not remove_audio_tracks(path, output_path, [0], audio_tracks):
+        raise RuntimeError(f"remux failed for {path}")
+    return {"input_bytes": os.path.getsize(path), "output_bytes": os.path.getsize(output_path)}
+
+
+def case_cut(path, output_path, start_seconds, end_seconds):
+    cut_with_ffmpeg(path, output_path, start_seconds, end_seconds)
+    return {"input_bytes": os.path.getsize(path), "output_bytes": os.path.getsize(output_path)}
+
+
+def case_fallback(path, output_path, start_seconds, end_seconds):
+    cut_with_moviepy(path, output_path, start_seconds, end_seconds)
+    return {"input_bytes": os.path.getsize(path), "output_bytes": os.path.getsize(output_path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark probe, remux, cut and re-encode fallback")
+    add_common_arguments(parser, "media")
+    parser.add_argument("--quick", action="store_true", help="Only use the small fixtures")
+    parser.add_argument("--no-fallback", action="store_true", help="Skip the MoviePy re-encode cases")
+    args = parser.parse_args()
+
+    os.makedirs(args.fixtures, exist_ok=True)
+    output_dir = os.path.join(args.fixtures, "out")
+    os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        import moviepy  # noqa: F401
+        fallback_available = not args.no_fallback
+    except ImportError:
+        fallback_available = False
+
+    results = {}
+    for name, size, duration, container, audio_tracks in FIXTURES:
+        if args.quick and name not in QUICK_FIXTURES:
+            continue
+        path = generate_fixture(args.fixtures, name, size, duration, container, audio_tracks)
+        start_seconds, end_seconds = duration // 4, duration * 3 // 4
+
+        results[f"probe/{name}"] = run_isolated(case_probe, (path,), args.repeat)
+        results[f"remux/{name}"] = run_isolated(
+            case_remux, (path, os.path.join(output_dir, f"remux_{name}.{container}")), args.repeat)
+        results[f"cut/{name}"] = run_isolated(
+            case_cut, (path, os.path.join(output_dir, f"cut_{name}.mp4"), start_seconds, end_seconds), args.repeat)
+        if fallback_available:
+            # One run is enough for the re-encode, it dwarfs any noise
+            results[f"fallback/{name}"] = run_isolated(
+                case_fallback, (path, os.path.join(output_dir, f"fallback_{name}.mp4"), start_seconds, end_seconds))
+        else:
+            results[f"fallback/{name}"] = {"skipped": "moviepy not installed or --no-fallback"}
+
+    return finish(args, "media", results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF split/merge benchmark
+本地生成合成PDF语料，测量拆分、合并和追加的耗时、内存与输出大小
+
+Usage:
+  python benchmarks/bench_pdf.py                    # Run and compare with baseline_pdf.json
+  python benchmarks/bench_pdf.py --update-baseline  # Store this run as the baseline
+  python benchmarks/bench_pdf.py --quick            # Smaller corpora
+
+Corpora:
+  many_pages   one document with thousands of text pages
+  shared_font  many documents that all embed the same large font program
+  many_small   hundreds of one-page documents
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+
+from benchlib import add_common_arguments, finish, run_isolated
+from PyPDF2 import PdfReader
+from pdf_genius import append_pdfs, merge_pdf_files, merge_pdf_files_parallel, write_pages
+
+FONT_PROGRAM_BYTES = 2 * 1024 * 1024
+
+
+def write_synthetic_pdf(path, page_texts, font_program=None):
+    """Write a minimal PDF with one Helvetica text line per page and an optional embedded font stream.
+
+    Pages share a single font (and font program), like real documents do.
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(None)
+    pages_id = add(None)
+    font_dict = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+    if font_program is not None:
+        font_file_id = add(b"<< /Length %d >>\nstream\n" % len(font_program) + font_program + b"\nendstream")
+        descriptor_id = add(b"<< /Type /FontDescriptor /FontName /Helvetica /Flags 32 "
+                            b"/FontBBox [0 0 1000 1000] /ItalicAngle 0 /Ascent 800 /Descent -200 "
+                            b"/CapHeight 700 /StemV 80 /FontFile %d 0 R >>" % font_file_id)
+        font_dict += b" /FontDescriptor %d 0 R" % descriptor_id
+    font_id = add(font_dict + b" >>")
+
+    page_ids = []
+    for text in page_texts:
+        content = b"BT /F1 12 Tf 72 720 Td (" + text.encode("latin-1") + b") Tj ET"
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+                            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                            % (pages_id, font_id, content_id)))
+
+    objects[catalog_id - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(b"%PDF-1.4\n")
+        offsets = []
+        for obj_id, body in enumerate(objects, 1):
+            offsets.append(pdf_file.tell())
+            pdf_file.write(b"%d 0 obj\n" % obj_id + body + b"\nendobj\n")
+        xref_offset = pdf_file.tell()
+        pdf_file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            pdf_file.write(b"%010d 00000 n \n" % offset)
+        pdf_file.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                       % (len(objects) + 1, catalog_id, xref_offset))
+    return path
+
+
+def generate_corpora(directory, quick):
+    """Create (or reuse) the deterministic corpora and return {name: [paths]}"""
+    rng = random.Random(1234)
+    font_program = rng.randbytes(FONT_PROGRAM_BYTES)
+    page_count = 500 if quick else 5000
+    shared_files = 10 if quick else 50
+    small_files = 50 if quick else 500
+
+    corpora = {}
+    corpus_dir = os.path.join(directory, "quick" if quick else "full")
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    path = os.path.join(corpus_dir, "many_pages.pdf")
+    if not os.path.exists(path):
+        write_synthetic_pdf(path, [f"Statement page {n} invoice number {1000 + n % 97}" for n in range(page_count)])
+    corpora["many_pages"] = [path]
+
+    corpora["shared_font"] = []
+    for n in range(shared_files):
+        path = os.path.join(corpus_dir, f"shared_font_{n:03d}.pdf")
+        if not os.path.exists(path):
+            write_synthetic_pdf(path, [f"Report {n} page {p}" for p in range(20)], font_program)
+        corpora["shared_font"].append(path)
+
+    corpora["many_small"] = []
+    for n in range(small_files):
+        path = os.path.join(corpus_dir, f"small_{n:04d}.pdf")
+        if not os.path.exists(path):
+            write_synthetic_pdf(path, [f"Daily report {n}"])
+        corpora["many_small"].append(path)
+    return corpora
+
+
+def case_split(input_path, output_path):
+    reader = PdfReader(input_path)
+    total_pages = len(reader.pages)
+    write_pages(reader, range(total_pages // 4, total_pages * 3 // 4), output_path)
+    return {"input_bytes": os.path.getsize(input_path), "output_bytes": os.path.getsize(output_path)}
+
+
+def case_merge(input_paths, output_path):
+    merge_pdf_files(input_paths, output_path)
+    return {"input_bytes": sum(os.path.getsize(path) for path in input_paths),
+            "output_bytes": os.path.getsize(output_path)}
+
+
+def case_merge_parallel(input_paths, output_path):
+    merge_pdf_files_parallel(input_paths, output_path)
+    return {"input_bytes": sum(os.path.getsize(path) for path in input_paths),
+            "output_bytes": os.path.getsize(output_path)}
+
+
+def case_append(base_path, input_paths, output_path):
+    shutil.copyfile(base_path, output_path)
+    base_size = os.path.getsize(output_path)
+    append_pdfs(output_path, input_paths)
+    return {"input_bytes": sum(os.path.getsize(path) for path in input_paths),
+            "output_bytes": os.path.getsize(output_path) - base_size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF split, merge and append")
+    add_common_arguments(parser, "pdf")
+    parser.add_argument("--quick", action="store_true", help="Use smaller corpora")
+    args = parser.parse_args()
+
+    corpora = generate_corpora(args.fixtures, args.quick)
+    output_dir = os.path.join(args.fixtures, "out")
+    os.makedirs(output_dir, exist_ok=True)
+
+    def output(name):
+        return os.path.join(output_dir, f"{name}.pdf")
+
+    results = {
+        "split/many_pages": run_isolated(
+            case_split, (corpora["many_pages"][0], output("split_many_pages")), args.repeat, trace_memory=True),
+        "merge/shared_font": run_isolated(
+            case_merge, (corpora["shared_font"], output("merge_shared_font")), args.repeat, trace_memory=True),
+        "merge/many_small": run_isolated(
+            case_merge, (corpora["many_small"], output("merge_many_small")), args.repeat, trace_memory=True),
+        "merge_parallel/shared_font": run_isolated(
+            case_merge_parallel, (corpora["shared_font"], output("merge_parallel_shared_font")), args.repeat),
+        "merge_parallel/many_small": run_isolated(
+            case_merge_parallel, (corpora["many_small"], output("merge_parallel_many_small")), args.repeat),
+        "append/many_small": run_isolated(
+            case_append, (corpora["many_pages"][0], corpora["many_small"][:10], output("append_many_small")),
+            args.repeat, trace_memory=True),
+    }
+    return finish(args, "pdf", results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the benchmark scripts: isolated case runs, reports and baseline comparison
+
+Each case runs in a fresh spawned interpreter so peak RSS (of the worker and of
+any ffmpeg children it started) belongs to that case alone.
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Metrics where a larger value is a regression
+COMPARED_METRICS = ("wall_seconds", "peak_rss_mb", "peak_traced_mb", "output_bytes")
+
+
+def _max_rss_mb(who):
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _run_case(func, args, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args) or {}
+    wall_seconds = time.perf_counter() - started
+    metrics = {"wall_seconds": wall_seconds}
+    if trace_memory:
+        metrics["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    self_rss = _max_rss_mb(resource.RUSAGE_SELF) if resource else None
+    children_rss = _max_rss_mb(resource.RUSAGE_CHILDREN) if resource else None
+    if self_rss is not None:
+        metrics["peak_rss_mb"] = max(self_rss, children_rss or 0)
+    metrics.update(result)
+    return metrics
+
+
+def run_isolated(func, args=(), repeat=1, trace_memory=False):
+    """Run func(*args) in fresh processes and keep the fastest of repeat runs.
+
+    func may return a dict of extra metrics (e.g. input_bytes, output_bytes).
+    """
+    runs = []
+    context = multiprocessing.get_context("spawn")
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(_run_case, func, args, trace_memory).result())
+    best = min(runs, key=lambda metrics: metrics["wall_seconds"])
+    if best.get("input_bytes") and best["wall_seconds"]:
+        best["mb_per_second"] = best["input_bytes"] / (1024 * 1024) / best["wall_seconds"]
+    return best
+
+
+def write_report(path, suite, results):
+    report = {
+        "suite": suite,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+    return report
+
+
+def compare_to_baseline(results, baseline_path, threshold):
+    """Return human-readable regressions of results against the stored baseline"""
+    try:
+        with open(baseline_path, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+    except FileNotFoundError:
+        print(f"No baseline at {baseline_path}; run with --update-baseline to create one")
+        return []
+
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        for metric in COMPARED_METRICS:
+            old = baseline.get(name, {}).get(metric)
+            new = metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change > threshold:
+                regressions.append(f"{name}: {metric} {old:.3f} -> {new:.3f} (+{change:.0%})")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'case':<40} {'wall s':>9} {'MB/s':>9} {'RSS MB':>9}")
+    for name, metrics in sorted(results.items()):
+        if "skipped" in metrics:
+            print(f"{name:<40} skipped: {metrics['skipped']}")
+            continue
+        mb_per_second = metrics.get("mb_per_second")
+        rss = metrics.get("peak_rss_mb")
+        print(f"{name:<40} {metrics['wall_seconds']:>9.3f} "
+              f"{mb_per_second if mb_per_second is not None else float('nan'):>9.1f} "
+              f"{rss if rss is not None else float('nan'):>9.1f}")
+
+
+def add_common_arguments(parser, suite):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument("--output", default=os.path.join(here, f"report_{suite}.json"),
+                        help="Where to write the JSON report")
+    parser.add_argument("--baseline", default=os.path.join(here, f"baseline_{suite}.json"),
+                        help="Baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown/growth before failing (default 0.25)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is kept")
+    parser.add_argument("--fixtures", default=os.path.join(here, ".fixtures"),
+                        help="Directory for generated fixtures")
+
+
+def finish(args, suite, results):
+    """Write the report, compare against (or update) the baseline, and return the exit code"""
+    print_results(results)
+    write_report(args.output, suite, results)
+    if args.update_baseline:
+        write_report(args.baseline, suite, results)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    regressions = compare_to_baseline(results, args.baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FFmpeg Job Engine
+所有ffmpeg/ffprobe子进程共用的asyncio执行引擎
+
+Every tool submits its ffmpeg/ffprobe commands here. One background event loop
+multiplexes all child processes from a single thread, with a concurrency limit,
+per-job timeouts, cancellation that stops the child, and streaming readers for
+stdout/stderr. Each child is first admitted by the resource governor (thread
+budget, per-device I/O tokens, background priority; see resource_governor.py).
+
+    from ffmpeg_engine import get_engine
+    result = get_engine().run(['ffprobe', '-version'], timeout=10)
+    future = get_engine().submit(cmd, on_stderr_line=print)  # concurrent.futures.Future
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from resource_governor import get_governor
+from tracing import is_enabled, new_track_id, span
+
+JobResult = namedtuple('JobResult', ['returncode', 'stdout', 'stderr', 'timed_out'])
+
+# ffmpeg rewrites its progress line with '\r', so treat it as a line break too
+LINE_BREAK = re.compile(rb'\r\n|\r|\n')
+TERMINATE_GRACE_SECONDS = 5
+
+
+async def _read_stream(stream, chunks, on_line):
+    buffer = b''
+    while True:
+        data = await stream.read(65536)
+        if not data:
+            break
+        chunks.append(data)
+        if on_line is None:
+            continue
+        buffer += data
+        lines = LINE_BREAK.split(buffer)
+        buffer = lines.pop()
+        for line in lines:
+            if line:
+                on_line(line.decode('utf-8', errors='replace'))
+    if on_line is not None and buffer:
+        on_line(buffer.decode('utf-8', errors='replace'))
+
+
+async def _stop_process(process):
+    """Ask the child to terminate, then kill it if it does not exit in time"""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), TERMINATE_GRACE_SECONDS)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+class FFmpegEngine:
+    """Run subprocesses on a shared asyncio loop with a concurrency limit"""
+
+    def __init__(self, max_concurrency=None, governor=None):
+        # Probes and remuxes mostly wait on I/O, so allow more children than cores
+        self.max_concurrency = max_concurrency or max(4, (os.cpu_count() or 1) * 2)
+        self.governor = governor or get_governor()
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._blocking_jobs = {}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                threading.Thread(target=self._loop.run_forever, name='ffmpeg-engine', daemon=True).start()
+        return self._loop
+
+    async def run_async(self, cmd, timeout=None, on_stdout_line=None, on_stderr_line=None, io_paths=None):
+        """Run cmd once the governor admits it and a concurrency slot is free; return its JobResult
+
+        io_paths overrides the files used for I/O tokens (by default the -i inputs and the last output).
+        """
+        queued = time.perf_counter()
+        # Jobs overlap on the engine thread, so each one gets its own trace track.
+        # The attributes are only built when tracing is on, since every job passes through here.
+        trace_args = {}
+        if is_enabled():
+            trace_args = {'tid': new_track_id(), 'program': os.path.basename(str(cmd[0])),
+                          'command': ' '.join(str(arg) for arg in cmd)}
+        with span('subprocess', 'ffmpeg', **trace_args) as job_span:
+            admission = await self.governor.admit_command(cmd, io_paths)
+            try:
+                async with self._semaphore:
+                    job_span.set('queued_ms', (time.perf_counter() - queued) * 1000)
+                    job_span.set('threads', admission.threads)
+                    return await self._run_admitted(cmd, admission, timeout, on_stdout_line, on_stderr_line,
+                                                    job_span)
+            finally:
+                self.governor.release(admission)
+
+    async def _run_admitted(self, cmd, admission, timeout, on_stdout_line, on_stderr_line, job_span):
+        launch_cmd, popen_kwargs = self.governor.launch(cmd, admission)
+        process = await asyncio.create_subprocess_exec(
+            *launch_cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **popen_kwargs,
+        )
+        stdout_chunks = []
+        stderr_chunks = []
+        timed_out = False
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                _read_stream(process.stdout, stdout_chunks, on_stdout_line),
+                _read_stream(process.stderr, stderr_chunks, on_stderr_line),
+                process.wait(),
+            ), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await _stop_process(process)
+        except asyncio.CancelledError:
+            await _stop_process(process)
+            raise
+
+        stdout = b''.join(stdout_chunks)
+        stderr = b''.join(stderr_chunks)
+        job_span.set('returncode', process.returncode)
+        job_span.set('stdout_bytes', len(stdout))
+        job_span.set('timed_out', timed_out)
+        return JobResult(
+            process.returncode,
+            stdout.decode('utf-8', errors='replace'),
+            stderr.decode('utf-8', errors='replace'),
+            timed_out,
+        )
+
+    def submit(self, cmd, timeout=None, on_stdout_line=None, on_stderr_line=None, io_paths=None):
+        """Schedule cmd and return a concurrent.futures.Future; cancelling it stops the child.
+
+        Line callbacks run on the engine thread, so GUI callers must marshal them (e.g. root.after).
+        """
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(
+            self.run_async(cmd, timeout, on_stdout_line, on_stderr_line, io_paths), loop
+        )
+
+    def run(self, cmd, timeout=None, on_stdout_line=None, on_stderr_line=None, io_paths=None):
+        """Run cmd and block until it finishes"""
+        future = self.submit(cmd, timeout, on_stdout_line, on_stderr_line, io_paths)
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._blocking_jobs.setdefault(thread_id, set()).add(future)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self._blocking_jobs[thread_id].discard(future)
+
+    @contextmanager
+    def reserve(self, io_paths=(), encode=True):
+        """Hold a governor admission for work that starts its own processes (e.g. MoviePy)"""
+        loop = self._ensure_loop()
+        with span('reserve', 'ffmpeg') as reserve_span:
+            admission = asyncio.run_coroutine_threadsafe(self.governor.admit(io_paths, encode), loop).result()
+            reserve_span.set('threads', admission.threads)
+        try:
+            yield admission
+        finally:
+            loop.call_soon_threadsafe(self.governor.release, admission)
+
+    def cancel_thread_jobs(self, thread_id):
+        """Cancel the jobs a thread is blocked on in run(); their children are stopped"""
+        with self._lock:
+            futures = list(self._blocking_jobs.get(thread_id, ()))
+        for future in futures:
+            future.cancel()
+
+
+def progress_line_handler(duration_seconds, callback):
+    """Turn `ffmpeg -progress pipe:1` output lines into callback(fraction) calls"""
+    def on_line(line):
+        key, _, value = line.partition('=')
+        if key == 'out_time_us' and duration_seconds and value.strip().isdigit():
+            callback(min(1.0, int(value) / 1e6 / duration_seconds))
+        elif key == 'progress' and value.strip() == 'end':
+            callback(1.0)
+    return on_line
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide engine shared by all tools"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FFmpegEngine()
+        return _engine
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Job Journal
+批处理断点续跑：记录每个任务的输入指纹、参数和输出状态
+
+An append-only JSON-lines journal, fsync'd after every record. A job is
+identified by its input fingerprint (size, mtime, hash of the first and last
+MiB) plus its parameters. On a rerun, completed jobs whose output is still
+intact are skipped. Outputs of jobs that never finished are deleted and
+redone, as are jobs whose input changed. One process at a time holds a journal:
+opening one that another live process holds raises JournalLockedError instead
+of deleting the outputs that process is still writing.
+
+    journal = JobJournal('batch.journal')
+    state = journal.run(input_path, output_path, {'keep': [0, 2]},
+                        lambda: remove_audio_tracks(...))   # 'done', 'skipped' or 'failed'
+
+func returns True on success, False on failure, or None when the input needs no
+output at all; such jobs are recorded as 'unchanged' and skipped on reruns.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+SAMPLE_BYTES = 1024 * 1024
+# State reported for a job function's result when it runs without a journal
+JOB_STATES = {True: 'done', False: 'failed', None: 'skipped'}
+
+
+class JournalLockedError(OSError):
+    pass
+
+
+def _lock_exclusive(lock_file):
+    """Lock an open file for this process without waiting; False if another process holds it"""
+    try:
+        if os.name == 'nt':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def fingerprint(path):
+    """Cheap content fingerprint: size, mtime and a hash of the head and tail of the file"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        if stat.st_size > 2 * SAMPLE_BYTES:
+            f.seek(-SAMPLE_BYTES, os.SEEK_END)
+        digest.update(f.read(SAMPLE_BYTES))
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+class JobJournal:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The lock is held until close() (or process exit, which releases it even after a crash)
+        self.lock_file = open(self.path.with_name(self.path.name + '.lock'), 'a+')
+        if not _lock_exclusive(self.lock_file):
+            self.lock_file.close()
+            raise JournalLockedError(f"Journal {self.path} is in use by another process")
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a torn last line; everything before it is intact
+                        continue
+                    self.jobs[record['job']] = record
+        # Terminate a torn last line so the next record starts on a line of its own
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, 'rb') as journal_file:
+                journal_file.seek(-1, os.SEEK_END)
+                torn = journal_file.read(1) != b'\n'
+        else:
+            torn = False
+        self.journal_file = open(self.path, 'a', encoding='utf-8')
+        if torn:
+            self.journal_file.write('\n')
+        self.cleanup_partial_outputs()
+
+    def _append(self, record):
+        record['time'] = time.time()
+        with self.lock:
+            self.journal_file.write(json.dumps(record, sort_keys=True) + '\n')
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+            self.jobs[record['job']] = record
+
+    @staticmethod
+    def job_id(input_fingerprint, params):
+        key = json.dumps({'input': input_fingerprint, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+    def cleanup_partial_outputs(self):
+        """Delete outputs of jobs that were started but never finished"""
+        for record in list(self.jobs.values()):
+            if record['state'] == 'started':
+                output_path = Path(record['output'])
+                if output_path.exists():
+                    output_path.unlink()
+                self._append(dict(record, state='abandoned'))
+
+    def is_complete(self, job, output_path):
+        record = self.jobs.get(job)
+        if record and record['state'] == 'unchanged':
+            return True
+        if not record or record['state'] != 'done':
+            return False
+        output_path = Path(output_path)
+        return output_path.exists() and output_path.stat().st_size == record['output_size']
+
+    def run(self, input_path, output_path, params, func):
+        """Run func() unless an identical job already completed; func returns True, False or None"""
+        if Path(output_path).resolve() == Path(input_path).resolve():
+            raise ValueError("Journaled jobs cannot write over their input")
+        input_fingerprint = fingerprint(input_path)
+        job = self.job_id(input_fingerprint, params)
+        if self.is_complete(job, output_path):
+            return 'skipped'
+
+        # Whatever sits at the output path now is stale or partial
+        output_path = Path(output_path)
+        if output_path.exists():
+            output_path.unlink()
+
+        record = {'job': job, 'input': str(input_path), 'output': str(output_path),
+                  'fingerprint': input_fingerprint, 'params': params}
+        self._append(dict(record, state='started'))
+        try:
+            success = func()
+        except Exception as e:
+            success = False
+            record['error'] = str(e)
+
+        if success is None:
+            self._append(dict(record, state='unchanged'))
+            return 'skipped'
+        if success and output_path.exists():
+            self._append(dict(record, state='done', output_size=output_path.stat().st_size))
+            return 'done'
+        if output_path.exists():
+            output_path.unlink()
+        self._append(dict(record, state='failed'))
+        return 'failed'
+
+    def close(self):
+        self.journal_file.close()
+        self.lock_file.close()
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Job Server
+本地HTTP/JSON任务服务：剪切、去音轨、PDF拆分和合并，直接在存储主机上处理本地路径
+
+Usage:
+  python job_server.py serve [--host 127.0.0.1] [--port 8765] [--workers 4] [--root /srv/media]
+  python job_server.py submit '{"type": "cut", "params": {"input": "/srv/a.mkv", "start": 60, "end": 120}}'
+  python job_server.py status <job_id>
+  python job_server.py watch <job_id>          # Stream progress until the job finishes
+
+API:
+  POST   /jobs                {"type": "cut"|"strip"|"split"|"merge", "priority": 0, "params": {...}}
+  GET    /jobs                All jobs
+  GET    /jobs/<id>           Status, progress (0-1), output path, error
+  GET    /jobs/<id>/events    JSON lines with status updates until the job finishes
+  GET    /jobs/<id>/result    The output file
+  DELETE /jobs/<id>           Cancel a queued or running job
+
+Lower priority values run first. Paths are local to the server; with --root every
+path must be inside that directory. Add --threads <n>, --io-tokens <n> and --background
+to bound the CPU and disk load of all jobs together (see resource_governor.py).
+
+Job params:
+  cut    input, start, end (seconds or HH:MM:SS), output (optional), mp4_layout (optional)
+  strip  input, keep_languages and/or drop_titles (lists) or tracks (0-based indices), output (optional),
+         mp4_layout (optional: faststart or fragmented)
+  split  input, pages (1-based numbers) or start/end, output (optional)
+  merge  inputs (list), output
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from ffmpeg_engine import get_engine
+from resource_governor import configure_from_argv
+from audio_track_remover import get_video_info, list_audio_tracks, remux_and_publish, select_tracks_by_policy
+from mp4_layout import LAYOUTS
+from video_cutter import cut_with_ffmpeg, time_to_seconds
+
+JOB_TYPES = ('cut', 'strip', 'split', 'merge')
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+def _split_job(input_path, page_numbers, output_path):
+    from pdf_genius import read_pdf, write_pages
+    reader = read_pdf(input_path)
+    invalid = [n for n in page_numbers if n < 1 or n > len(reader.pages)]
+    if invalid:
+        raise ValueError(f"Invalid pages {invalid}; PDF has {len(reader.pages)} pages")
+    write_pages(reader, [n - 1 for n in page_numbers], output_path)
+
+
+def _merge_job(input_paths, output_path):
+    from pdf_genius import merge_pdf_files
+    merge_pdf_files(input_paths, output_path)
+
+
+def _seconds(value):
+    return time_to_seconds(value) if isinstance(value, str) else float(value)
+
+
+def _checked_seconds(params, key):
+    if isinstance(params.get(key), bool) or not isinstance(params.get(key), (str, int, float)):
+        raise ValueError(f"cut jobs need {key}: seconds or HH:MM:SS")
+    seconds = _seconds(params[key])
+    if seconds < 0:
+        raise ValueError(f"{key} must not be negative")
+    return seconds
+
+
+def _checked_numbers(value, name):
+    """value as a non-empty list of ints; bools and numeric strings are rejected"""
+    if not isinstance(value, list) or not value or not all(
+            isinstance(n, int) and not isinstance(n, bool) for n in value):
+        raise ValueError(f"{name} must be a non-empty list of integers")
+    return value
+
+
+class Job:
+    def __init__(self, job_type, params, priority):
+        self.id = uuid.uuid4().hex[:12]
+        self.type = job_type
+        self.params = params
+        self.priority = priority
+        self.state = 'queued'
+        self.progress = 0.0
+        self.output = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = False
+        self.thread_id = None
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.changed.notify_all()
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'type': self.type, 'priority': self.priority, 'params': self.params,
+            'state': self.state, 'progress': round(self.progress, 4), 'output': self.output,
+            'error': self.error, 'created': self.created, 'started': self.started, 'finished': self.finished,
+        }
+
+
+class JobService:
+    def __init__(self, workers=4, root=None):
+        self.root = Path(root).resolve() if root else None
+        self.jobs = {}
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.process_pool = ProcessPoolExecutor(max_workers=workers)
+        for n in range(workers):
+            threading.Thread(target=self._worker, name=f'job-worker-{n}', daemon=True).start()
+
+    def _check_path(self, path, must_exist=True):
+        path = Path(path).resolve()
+        if self.root and self.root not in path.parents and path != self.root:
+            raise ValueError(f"Path outside the allowed root: {path}")
+        if must_exist and not path.exists():
+            raise ValueError(f"File not found: {path}")
+        return path
+
+    def submit(self, job_type, params, priority=0):
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type {job_type!r}; expected one of {', '.join(JOB_TYPES)}")
+        if not isinstance(params, dict):
+            raise ValueError("params must be a JSON object")
+        if job_type == 'merge':
+            if not isinstance(params.get('inputs'), list) or not params['inputs']:
+                raise ValueError("merge jobs need inputs: a list of paths")
+        elif not isinstance(params.get('input'), str):
+            raise ValueError(f"{job_type} jobs need an input path")
+        for key in ('input', 'output'):
+            if params.get(key) is not None and not isinstance(params[key], str):
+                raise ValueError(f"{key} must be a path string")
+        if not all(isinstance(path, str) for path in params.get('inputs', [])):
+            raise ValueError("inputs must be path strings")
+        for path in params.get('inputs', []) + ([params['input']] if 'input' in params else []):
+            self._check_path(path)
+        if params.get('output'):
+            self._check_path(params['output'], must_exist=False)
+        if job_type == 'merge' and not params.get('output'):
+            raise ValueError("merge jobs need an output path")
+        if params.get('mp4_layout') not in (None,) + LAYOUTS:
+            raise ValueError(f"mp4_layout must be one of {', '.join(LAYOUTS)}")
+        getattr(self, f'_check_{job_type}', lambda params: None)(params)
+
+        job = Job(job_type, params, priority)
+        self.jobs[job.id] = job
+        self.queue.put((priority, next(self.sequence), job.id))
+        return job
+
+    def cancel(self, job):
+        job.cancel_requested = True
+        if job.state == 'running':
+            # ffmpeg children are stopped; a PDF job already inside the pool runs to completion
+            get_engine().cancel_thread_jobs(job.thread_id)
+            future = getattr(job, 'future', None)
+            if future is not None:
+                future.cancel()
+        elif job.state == 'queued':
+            job.update(state='cancelled', finished=time.time())
+
+    def _worker(self):
+        while True:
+            _, _, job_id = self.queue.get()
+            job = self.jobs[job_id]
+            if job.cancel_requested:
+                continue
+            job.thread_id = threading.get_ident()
+            job.update(state='running', started=time.time())
+            try:
+                output = getattr(self, f'_run_{job.type}')(job)
+                if job.cancel_requested:
+                    job.update(state='cancelled', finished=time.time())
+                else:
+                    job.update(state='done', progress=1.0, output=str(output), finished=time.time())
+            except CancelledError:
+                job.update(state='cancelled', finished=time.time())
+            except Exception as e:
+                job.update(state='cancelled' if job.cancel_requested else 'failed',
+                           error=str(e), finished=time.time())
+
+    # Malformed or out-of-range params are rejected at submit, so the client gets a 400 instead of a failed job
+    def _check_cut(self, params):
+        if _checked_seconds(params, 'start') >= _checked_seconds(params, 'end'):
+            raise ValueError("End time must be greater than start time")
+
+    def _check_strip(self, params):
+        for key in ('keep_languages', 'drop_titles'):
+            if params.get(key) is not None and not (
+                    isinstance(params[key], list) and all(isinstance(item, str) for item in params[key])):
+                raise ValueError(f"{key} must be a list of strings")
+        if 'tracks' in params:
+            tracks = _checked_numbers(params['tracks'], 'tracks')
+            video_info = get_video_info(params['input'])
+            if not video_info:
+                raise ValueError(f"Cannot read video info of {params['input']}")
+            track_count = len(list_audio_tracks(video_info))
+            invalid = [i for i in tracks if not 0 <= i < track_count]
+            if invalid:
+                raise ValueError(f"Invalid tracks {invalid}; the input has {track_count} audio tracks (0-based)")
+
+    def _check_split(self, params):
+        from pdf_genius import read_pdf
+        if params.get('pages') is not None:
+            pages = _checked_numbers(params['pages'], 'pages')
+        else:
+            start, end = params.get('start'), params.get('end')
+            if not all(isinstance(n, int) and not isinstance(n, bool) for n in (start, end)):
+                raise ValueError("split jobs need pages (a list) or integer start and end")
+            if start > end:
+                raise ValueError("start must not be after end")
+            pages = [start, end]
+        try:
+            page_count = len(read_pdf(params['input']).pages)
+        except Exception as e:
+            raise ValueError(f"Cannot read PDF {params['input']}: {e}")
+        invalid = [n for n in pages if n < 1 or n > page_count]
+        if invalid:
+            raise ValueError(f"Invalid pages {invalid}; PDF has {page_count} pages")
+
+    def _default_output(self, input_path, suffix):
+        input_path = Path(input_path)
+        return input_path.parent / f"{input_path.stem}{suffix}"
+
+    def _run_cut(self, job):
+        params = job.params
+        start_seconds, end_seconds = _seconds(params['start']), _seconds(params['end'])
+        if start_seconds >= end_seconds:
+            raise ValueError("End time must be greater than start time")
+        output = params.get('output') or self._default_output(
+            params['input'], f"_cut_{int(start_seconds)}_{int(end_seconds)}{Path(params['input']).suffix}")
+        cut_with_ffmpeg(str(params['input']), str(output), start_seconds, end_seconds,
+                        progress=lambda fraction: job.update(progress=fraction), mp4_layout=params.get('mp4_layout'))
+        return output
+
+    def _run_strip(self, job):
+        params = job.params
+        video_info = get_video_info(params['input'])
+        if not video_info:
+            raise RuntimeError("Failed to get video info")
+        audio_tracks = list_audio_tracks(video_info)
+        if 'tracks' in params:
+            tracks_to_keep = params['tracks']
+        else:
+            tracks_to_keep = select_tracks_by_policy(
+                audio_tracks, params.get('keep_languages'), params.get('drop_titles'))
+        if not tracks_to_keep:
+            raise ValueError("No audio track would be kept")
+
+        output = params.get('output') or self._default_output(
+            params['input'], f"_cleaned{Path(params['input']).suffix}")
+        if remux_and_publish(params['input'], output, tracks_to_keep, audio_tracks, video_info,
+                             progress=lambda fraction: job.update(progress=fraction),
+                             mp4_layout=params.get('mp4_layout')) is None:
+            raise RuntimeError("Failed to remove audio tracks")
+        return output
+
+    def _run_split(self, job):
+        params = job.params
+        pages = params.get('pages') or list(range(params['start'], params['end'] + 1))
+        output = params.get('output') or self._default_output(
+            params['input'], f"_pages_{min(pages)}_to_{max(pages)}.pdf")
+        job.future = self.process_pool.submit(_split_job, params['input'], pages, str(output))
+        job.future.result()
+        return output
+
+    def _run_merge(self, job):
+        params = job.params
+        job.future = self.process_pool.submit(_merge_job, list(params['inputs']), params['output'])
+        job.future.result()
+        return params['output']
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _find_job(self, parts):
+        job = self.service.jobs.get(parts[1]) if len(parts) > 1 else None
+        if job is None:
+            self._send_json(404, {'error': 'No such job'})
+        return job
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            return self._send_json(404, {'error': 'Not found'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not isinstance(body, dict):
+                raise ValueError("The request body must be a JSON object")
+            job = self.service.submit(body.get('type'), body.get('params', {}), int(body.get('priority', 0)))
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json(400, {'error': str(e)})
+        self._send_json(202, job.to_dict())
+
+    def do_DELETE(self):
+        parts = self.path.strip('/').split('/')
+        job = self._find_job(parts)
+        if job is not None:
+            self.service.cancel(job)
+            self._send_json(200, job.to_dict())
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts[0] != 'jobs':
+            return self._send_json(404, {'error': 'Not found'})
+        if len(parts) == 1:
+            return self._send_json(200, [job.to_dict() for job in self.service.jobs.values()])
+
+        job = self._find_job(parts)
+        if job is None:
+            return
+        if len(parts) == 2:
+            return self._send_json(200, job.to_dict())
+        if parts[2] == 'events':
+            return self._stream_events(job)
+        if parts[2] == 'result':
+            return self._stream_result(job)
+        self._send_json(404, {'error': 'Not found'})
+
+    def _stream_events(self, job):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        last = None
+        while True:
+            with job.changed:
+                snapshot = job.to_dict()
+                if snapshot == last:
+                    job.changed.wait(timeout=15)
+                    snapshot = job.to_dict()
+            if snapshot != last:
+                self.wfile.write((json.dumps(snapshot) + '\n').encode('utf-8'))
+                self.wfile.flush()
+                last = snapshot
+            if snapshot['state'] in FINISHED_STATES:
+                return
+
+    def _stream_result(self, job):
+        if job.state != 'done':
+            return self._send_json(409, {'error': f"Job is {job.state}"})
+        size = os.path.getsize(job.output)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(job.output)}"')
+        self.end_headers()
+        with open(job.output, 'rb') as output_file:
+            shutil.copyfileobj(output_file, self.wfile, 1024 * 1024)
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+
+
+def serve(host, port, workers, root):
+    JobRequestHandler.service = JobService(workers, root)
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    print(f"Job server listening on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _request(url, method='GET', body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    return urllib.request.urlopen(request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local HTTP/JSON job service for cut, strip, split and merge')
+    parser.add_argument('--url', default='http://127.0.0.1:8765', help='Server URL for client commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the job server')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--workers', type=int, default=4, help='Jobs running at the same time')
+    serve_parser.add_argument('--root', help='Only allow paths inside this directory')
+
+    submit_parser = subparsers.add_parser('submit', help='Submit a job given as JSON')
+    submit_parser.add_argument('job')
+    status_parser = subparsers.add_parser('status', help='Show a job')
+    status_parser.add_argument('job_id')
+    watch_parser = subparsers.add_parser('watch', help='Stream job progress until it finishes')
+    watch_parser.add_argument('job_id')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args.host, args.port, args.workers, args.root)
+        return 0
+    try:
+        if args.command == 'submit':
+            with _request(f"{args.url}/jobs", 'POST', json.loads(args.job)) as response:
+                print(response.read().decode('utf-8'))
+        elif args.command == 'status':
+            with _request(f"{args.url}/jobs/{args.job_id}") as response:
+                print(response.read().decode('utf-8'))
+        else:
+            with _request(f"{args.url}/jobs/{args.job_id}/events") as response:
+                for line in response:
+                    print(line.decode('utf-8').rstrip(), flush=True)
+    except urllib.error.HTTPError as e:
+        print(f"Error {e.code}: {e.read().decode('utf-8')}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    configure_from_argv(sys.argv)
+    sys.exit(main())
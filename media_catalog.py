@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Media Catalog
+把视频文件的音轨信息扫描进SQLite索引，方便跨大量文件查询
+
+Usage:
+  python media_catalog.py scan <dir> [<dir> ...]          # Scan (incrementally) into the catalog
+  python media_catalog.py query --min-audio 3             # Files with at least 3 audio tracks
+  python media_catalog.py query --codec dts               # Files with a DTS audio track
+  python media_catalog.py query --missing-lang eng        # Files without an English audio track
+
+Query output is one path per line and can be fed to the remover:
+  python media_catalog.py query --codec dts | python audio_track_remover.py --cli -
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from audio_track_remover import VIDEO_EXTENSIONS, get_video_info, list_audio_tracks
+
+DEFAULT_DB_PATH = Path.home() / '.cache' / 'audio_track_remover' / 'catalog.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format_name TEXT,
+    duration REAL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS audio_tracks (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    "index" INTEGER NOT NULL,
+    stream_index INTEGER,
+    codec TEXT,
+    language TEXT,
+    title TEXT,
+    channels,
+    sample_rate,
+    bitrate
+);
+CREATE INDEX IF NOT EXISTS audio_tracks_file ON audio_tracks(file_id);
+CREATE INDEX IF NOT EXISTS audio_tracks_codec ON audio_tracks(codec);
+CREATE INDEX IF NOT EXISTS audio_tracks_language ON audio_tracks(language);
+"""
+
+TRACK_COLUMNS = ('index', 'stream_index', 'codec', 'language', 'title', 'channels', 'sample_rate', 'bitrate')
+
+
+def open_catalog(db_path=DEFAULT_DB_PATH):
+    """Open (and create if needed) the catalog database"""
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def find_video_files(root):
+    """Yield every video file under root"""
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if Path(filename).suffix.lower() in VIDEO_EXTENSIONS:
+                yield Path(dirpath) / filename
+
+
+def _probe(path):
+    video_info = get_video_info(path)
+    if not video_info:
+        return path, None, []
+    return path, video_info.get('format', {}), list_audio_tracks(video_info)
+
+
+def scan(conn, roots, workers=8, progress=None):
+    """Incrementally scan roots, probing only new or changed files; returns (probed, skipped, removed)"""
+    known = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT path, size, mtime_ns FROM files')}
+    seen = set()
+    to_probe = []
+    for root in roots:
+        for path in find_video_files(root):
+            try:
+                stat = path.stat()
+            except OSError:
+                # Dangling symlink or deleted mid-scan; its old row is removed below like any vanished file
+                continue
+            key = str(path.resolve())
+            seen.add(key)
+            if known.get(key) != (stat.st_size, stat.st_mtime_ns):
+                to_probe.append((path, key, stat))
+
+    stats = {str(path): (key, stat) for path, key, stat in to_probe}
+    probed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, format_info, audio_tracks in executor.map(_probe, [path for path, _, _ in to_probe]):
+            key, stat = stats[str(path)]
+            if format_info is None:
+                # The file changed into something unreadable; its old row no longer describes it
+                conn.execute('DELETE FROM files WHERE path = ?', (key,))
+                continue
+            try:
+                duration = float(format_info.get('duration'))
+            except (TypeError, ValueError):
+                duration = None
+
+            conn.execute('DELETE FROM files WHERE path = ?', (key,))
+            cursor = conn.execute(
+                'INSERT INTO files (path, size, mtime_ns, format_name, duration, scanned_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, stat.st_size, stat.st_mtime_ns, format_info.get('format_name'), duration, time.time())
+            )
+            conn.executemany(
+                'INSERT INTO audio_tracks (file_id, "index", stream_index, codec, language, title, channels, '
+                'sample_rate, bitrate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(cursor.lastrowid, *(track[column] for column in TRACK_COLUMNS)) for track in audio_tracks]
+            )
+            probed += 1
+            if progress:
+                progress(path)
+            # Commit in batches so an interrupted scan keeps most of its work
+            if probed % 100 == 0:
+                conn.commit()
+
+    # Forget files that disappeared from the scanned roots
+    resolved_roots = [str(Path(root).resolve()) for root in roots]
+    removed = [path for path in known
+               if path not in seen and any(path.startswith(root + os.sep) for root in resolved_roots)]
+    conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+    conn.commit()
+    return probed, len(seen) - len(to_probe), len(removed)
+
+
+def query(conn, min_audio=None, max_audio=None, codec=None, language=None, missing_language=None):
+    """Return the paths of catalogued files matching every given condition"""
+    conditions = []
+    params = []
+    if min_audio is not None:
+        conditions.append('(SELECT COUNT(*) FROM audio_tracks a WHERE a.file_id = f.id) >= ?')
+        params.append(min_audio)
+    if max_audio is not None:
+        conditions.append('(SELECT COUNT(*) FROM audio_tracks a WHERE a.file_id = f.id) <= ?')
+        params.append(max_audio)
+    if codec:
+        conditions.append('EXISTS (SELECT 1 FROM audio_tracks a WHERE a.file_id = f.id AND a.codec = ?)')
+        params.append(codec.lower())
+    if language:
+        conditions.append('EXISTS (SELECT 1 FROM audio_tracks a WHERE a.file_id = f.id AND a.language = ?)')
+        params.append(language)
+    if missing_language:
+        conditions.append('NOT EXISTS (SELECT 1 FROM audio_tracks a WHERE a.file_id = f.id AND a.language = ?)')
+        params.append(missing_language)
+
+    sql = 'SELECT f.path FROM files f'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY f.path'
+    return [row[0] for row in conn.execute(sql, params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Catalog audio tracks of video files into SQLite')
+    parser.add_argument('--db', default=str(DEFAULT_DB_PATH), help='Catalog database path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan_parser = subparsers.add_parser('scan', help='Scan directories into the catalog')
+    scan_parser.add_argument('roots', nargs='+')
+    scan_parser.add_argument('--workers', type=int, default=8, help='Concurrent ffprobe processes')
+
+    query_parser = subparsers.add_parser('query', help='List catalogued files matching all conditions')
+    query_parser.add_argument('--min-audio', type=int, help='At least this many audio tracks')
+    query_parser.add_argument('--max-audio', type=int, help='At most this many audio tracks')
+    query_parser.add_argument('--codec', help='Has an audio track with this codec (e.g. dts)')
+    query_parser.add_argument('--lang', help='Has an audio track in this language')
+    query_parser.add_argument('--missing-lang', help='Has no audio track in this language')
+
+    args = parser.parse_args()
+    conn = open_catalog(args.db)
+
+    if args.command == 'scan':
+        probed, skipped, removed = scan(conn, args.roots, args.workers,
+                                        progress=lambda path: print(f"Probed: {path}", file=sys.stderr))
+        print(f"Scan complete: {probed} probed, {skipped} unchanged, {removed} removed", file=sys.stderr)
+    else:
+        for path in query(conn, args.min_audio, args.max_audio, args.codec, args.lang, args.missing_lang):
+            print(path)
+
+
+if __name__ == '__main__':
+    main()
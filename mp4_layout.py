@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MP4 Layout
+MP4输出的faststart/分片选项，以及纯Python检查moov在文件中的位置
+
+Usage:
+  python mp4_layout.py check <file_or_dir> [...]      # Report where moov sits in each MP4/MOV file
+  python mp4_layout.py check --paths-only <dir>       # Only print files whose moov is at the end
+  python mp4_layout.py fix <file> [...]               # Rewrite those files with moov at the start
+
+Output layouts for the remover and cutter:
+  faststart   moov before mdat. ffmpeg reserves room for moov at the start of the file
+              (-moov_size) so it is written in the same pass. If the estimate is too small,
+              it falls back to +faststart, which shifts the data within the same file.
+  fragmented  fragmented MP4 (empty moov, one fragment per keyframe), playable while streaming
+"""
+
+import argparse
+import os
+import struct
+import sys
+from pathlib import Path
+
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.m4a', '.mov'}
+LAYOUTS = ('default', 'faststart', 'fragmented')
+
+FASTSTART_FALLBACK_ARGS = ['-movflags', '+faststart']
+FRAGMENTED_ARGS = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof']
+# Sample tables cost roughly this much per sample (stsz, stco, stts/ctts, stss entries)
+MOOV_BYTES_PER_SAMPLE = 16
+MOOV_BASE_BYTES = 64 * 1024
+
+
+def is_mp4_path(path):
+    return Path(path).suffix.lower() in MP4_EXTENSIONS
+
+
+def _rate(value):
+    numerator, _, denominator = str(value or '0/1').partition('/')
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def estimate_moov_bytes(video_info, duration=None, stream_indices=None):
+    """Upper estimate of the moov size for the streams in video_info over duration seconds
+
+    stream_indices limits the estimate to the input streams that are written to the output.
+    """
+    duration = duration or float(video_info.get('format', {}).get('duration') or 0)
+    samples = 0
+    for stream in video_info.get('streams', []):
+        if stream_indices is not None and stream.get('index') not in stream_indices:
+            continue
+        if stream.get('codec_type') == 'video':
+            samples += duration * (_rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate')) or 60)
+        elif stream.get('codec_type') == 'audio':
+            sample_rate = int(stream.get('sample_rate') or 48000)
+            samples += duration * sample_rate / (int(stream.get('frame_size') or 0) or 1024)
+        elif stream.get('codec_type') == 'subtitle':
+            samples += duration  # Generous: about one cue per second
+    return int(samples * MOOV_BYTES_PER_SAMPLE * 1.25) + MOOV_BASE_BYTES
+
+
+def output_args(layout, output_path, video_info=None, duration=None, stream_indices=None):
+    """Muxer options for an output path; empty unless it is an MP4/MOV file and a layout is chosen"""
+    if not layout or layout == 'default' or not is_mp4_path(output_path):
+        return []
+    if layout == 'fragmented':
+        return list(FRAGMENTED_ARGS)
+    if layout != 'faststart':
+        raise ValueError(f"Unknown MP4 layout '{layout}' (choose from {', '.join(LAYOUTS)})")
+    if video_info:
+        # moov is written into space reserved up front, so the data is never moved
+        return ['-moov_size', str(estimate_moov_bytes(video_info, duration, stream_indices))]
+    return list(FASTSTART_FALLBACK_ARGS)
+
+
+def reserved_space_too_small(stderr):
+    """True when ffmpeg failed because the -moov_size reservation was too small"""
+    return 'reserved_moov_size' in (stderr or '')
+
+
+def with_faststart_fallback(cmd):
+    """Replace a -moov_size reservation in cmd with +faststart"""
+    position = cmd.index('-moov_size')
+    return cmd[:position] + FASTSTART_FALLBACK_ARGS + cmd[position + 2:]
+
+
+def top_level_boxes(path):
+    """Yield (type, offset, size) of the top-level boxes of an ISO BMFF file, reading only headers"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as mp4_file:
+        offset = 0
+        while offset + 8 <= file_size:
+            mp4_file.seek(offset)
+            size, box_type = struct.unpack('>I4s', mp4_file.read(8))
+            header_size = 8
+            if size == 1:
+                size = struct.unpack('>Q', mp4_file.read(8))[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - offset
+            if size < header_size:
+                raise ValueError(f"Corrupt box at offset {offset} in {path}")
+            yield box_type.decode('latin-1'), offset, size
+            offset += size
+
+
+def moov_position(path):
+    """Where the movie header sits: 'start', 'end', 'fragmented', or 'missing'"""
+    moov_offset = mdat_offset = None
+    for box_type, offset, _ in top_level_boxes(path):
+        if box_type == 'moof':
+            return 'fragmented'
+        if box_type == 'moov' and moov_offset is None:
+            moov_offset = offset
+        elif box_type == 'mdat' and mdat_offset is None:
+            mdat_offset = offset
+    if moov_offset is None:
+        return 'missing'
+    if mdat_offset is None or moov_offset < mdat_offset:
+        return 'start'
+    return 'end'
+
+
+def find_mp4_files(paths):
+    for path in map(Path, paths):
+        if path.is_dir():
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if is_mp4_path(name):
+                        yield Path(root) / name
+        else:
+            yield path
+
+
+def fix_file(path):
+    """Rewrite one file with moov at the start (stream copy, staged and atomically replaced)"""
+    from audio_track_remover import get_video_info, run_ffmpeg_command
+    from staged_output import clean_stale_partials, discard, ensure_free_space, publish, staging_path_for
+
+    path = Path(path)
+    video_info = get_video_info(path)
+    if not video_info:
+        return False
+    clean_stale_partials(path.parent)
+    ensure_free_space(path.stat().st_size, path.parent)
+    staged_path = staging_path_for(path)
+    cmd = ['ffmpeg', '-y', '-i', str(path), '-map', '0', '-c', 'copy']
+    cmd += output_args('faststart', path, video_info) + [str(staged_path)]
+    try:
+        success, _, stderr = run_ffmpeg_command(cmd)
+        if not success and reserved_space_too_small(stderr):
+            success, _, stderr = run_ffmpeg_command(with_faststart_fallback(cmd))
+        if not success:
+            print(f"Failed to fix {path}: {stderr.strip()[-500:]}")
+            return False
+        publish(staged_path, path)
+    finally:
+        discard(staged_path)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check or fix the position of the moov atom in MP4 files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    check_parser = subparsers.add_parser('check', help='Report where moov sits')
+    check_parser.add_argument('paths', nargs='+', help='Files or directories (searched recursively)')
+    check_parser.add_argument('--paths-only', action='store_true',
+                              help='Only print the files whose moov is at the end')
+    fix_parser = subparsers.add_parser('fix', help='Move moov to the start of the given files')
+    fix_parser.add_argument('paths', nargs='+')
+    args = parser.parse_args(argv)
+
+    needs_fix = 0
+    for path in find_mp4_files(args.paths):
+        try:
+            position = moov_position(path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"error       {path}: {e}", file=sys.stderr)
+            needs_fix += 1
+            continue
+
+        if args.command == 'check':
+            if position == 'end':
+                needs_fix += 1
+            if not args.paths_only:
+                print(f"{position:<11} {path}")
+            elif position == 'end':
+                print(path)
+        elif position == 'end':
+            print(f"Fixing {path}")
+            if not fix_file(path):
+                needs_fix += 1
+    return 1 if needs_fix else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
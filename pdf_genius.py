@@ -1,7 +1,732 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject
+)
+from PyPDF2.filters import FlateDecode
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from io import BytesIO
+import hashlib
+import json
 import os
+import re
+import threading
+import sys
+import time
+import zlib
+
+from tracing import enable_from_argv, span
+
+# Pillow is only needed for the shrink operation
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+SHRINK_COLOR_MODES = {"/DeviceGray": "L", "/DeviceRGB": "RGB"}
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdf_genius")
+TERM_PATTERN = re.compile(r"\w+")
+
+
+def write_pages(reader, page_indices, output_path):
+    writer = PdfWriter()
+    with span("add_pages", "pdf") as add_span:
+        for page_num in page_indices:
+            writer.add_page(reader.pages[page_num])
+        add_span.set("pages", len(writer.pages))
+    write_pdf(writer, output_path)
+
+
+def write_pdf(writer, output_path):
+    with span("write", "pdf", path=output_path, pages=len(writer.pages)) as write_span:
+        with open(output_path, "wb") as output_file:
+            writer.write(output_file)
+            write_span.set("bytes", output_file.tell())
+
+
+def read_pdf(path):
+    with span("parse", "pdf", path=str(path)):
+        return PdfReader(path)
+
+
+class PdfInputError(Exception):
+    """An input PDF could not be read"""
+
+
+def merge_pdf_files(pdf_paths, output_path):
+    writer = PdfWriter()
+    # PdfWriter remembers copied objects by id(reader), so a reader freed early could have its id reused
+    readers = []
+    for pdf_path in pdf_paths:
+        try:
+            reader = read_pdf(pdf_path)
+            readers.append(reader)
+            # Add all pages from this PDF
+            with span("add_pages", "pdf", path=pdf_path, pages=len(reader.pages)):
+                for page in reader.pages:
+                    writer.add_page(page)
+        except Exception as e:
+            raise PdfInputError(f"Failed to read {os.path.basename(pdf_path)}: {str(e)}")
+
+    # Write the merged PDF
+    write_pdf(writer, output_path)
+
+
+def flatten_outline(reader, outline=None, level=1):
+    """Flatten the nested outline into (level, title, page, children) tuples in document order"""
+    if outline is None:
+        outline = reader.outline
+    entries = []
+    for i, item in enumerate(outline):
+        if isinstance(item, list):
+            continue
+        children = outline[i + 1] if i + 1 < len(outline) and isinstance(outline[i + 1], list) else []
+        page = reader.get_destination_page_number(item)
+        if page < 0:
+            continue
+        entries.append((level, item.title or "Untitled", page, children))
+        entries.extend(flatten_outline(reader, children, level + 1))
+    return entries
+
+
+def outline_chapters(reader, depth=1):
+    """Compute (title, start, end, children) page ranges for every bookmark at or above depth"""
+    total_pages = len(reader.pages)
+    split_points = [entry for entry in flatten_outline(reader) if entry[0] <= depth]
+    split_points.sort(key=lambda entry: entry[2])
+
+    chapters = []
+    if split_points and split_points[0][2] > 0:
+        chapters.append(("Front Matter", 0, split_points[0][2] - 1, []))
+    for i, (level, title, start, children) in enumerate(split_points):
+        end = split_points[i + 1][2] - 1 if i + 1 < len(split_points) else total_pages - 1
+        # Bookmarks sharing a page with the next one (e.g. a part and its first chapter) have no pages of their own
+        if end < start:
+            continue
+        sub_children = children if level == depth else []
+        chapters.append((title, start, end, sub_children))
+    return chapters
+
+
+def add_sub_outline(writer, reader, outline, start, end, parent=None):
+    last_item = parent
+    for item in outline:
+        if isinstance(item, list):
+            # Children of the previous item; keep them only if that item made it into the range
+            if last_item is not parent:
+                add_sub_outline(writer, reader, item, start, end, last_item)
+            continue
+        page = reader.get_destination_page_number(item)
+        if start <= page <= end:
+            last_item = writer.add_outline_item(item.title or "Untitled", page - start, parent=parent)
+        else:
+            last_item = parent
+
+
+def split_by_outline(input_path, depth=1, output_dir=None, max_workers=4):
+    """Split a PDF into one file per bookmark at the given depth from a single parse"""
+    reader = read_pdf(input_path)
+    with span("outline", "pdf", depth=depth):
+        chapters = outline_chapters(reader, depth)
+    if not chapters:
+        raise ValueError("This PDF has no bookmarks to split on")
+
+    if output_dir is None:
+        output_dir = os.path.dirname(input_path)
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+
+    def write_chapter(writer, output_path):
+        write_pdf(writer, output_path)
+        return output_path
+
+    # Pages are cloned into each writer here on the calling thread, so the
+    # workers only serialize writer-owned objects and never touch the reader
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for number, (title, start, end, children) in enumerate(chapters, 1):
+            writer = PdfWriter()
+            with span("add_pages", "pdf", chapter=title, pages=end - start + 1):
+                for page_num in range(start, end + 1):
+                    writer.add_page(reader.pages[page_num])
+                add_sub_outline(writer, reader, children, start, end)
+
+            safe_title = re.sub(r"[^\w\- ]+", "", title).strip()[:60] or "chapter"
+            output_path = os.path.join(output_dir, f"{stem}_{number:02d}_{safe_title}.pdf")
+            futures.append(executor.submit(write_chapter, writer, output_path))
+        return [future.result() for future in futures]
+
+
+class PageObjectCopier:
+    """Copy pages and everything they reference into a fresh, contiguous object-ID range"""
+
+    def __init__(self, next_id, parent_ref):
+        self.next_id = next_id
+        self.parent_ref = parent_ref
+        self.id_map = {}
+        self.page_keys = set()
+        self.pending = []
+
+    def _key(self, ref):
+        return id(ref.pdf), ref.idnum, ref.generation
+
+    def reference(self, ref):
+        key = self._key(ref)
+        if key not in self.id_map:
+            self.id_map[key] = self.next_id
+            self.pending.append((self.next_id, ref))
+            self.next_id += 1
+        return IndirectObject(self.id_map[key], 0, None)
+
+    def add_page(self, page):
+        self.page_keys.add(self._key(page.indirect_reference))
+        return self.reference(page.indirect_reference)
+
+    def copy(self, obj, key=None):
+        if isinstance(obj, IndirectObject):
+            target = obj.get_object()
+            # Never follow a link back into the source page tree, it would drag in every page
+            if isinstance(target, DictionaryObject) and target.get("/Type") == "/Pages":
+                return NullObject()
+            return self.reference(obj)
+        if isinstance(obj, StreamObject):
+            new_obj = obj.__class__()
+            new_obj._data = obj._data
+            for name, value in obj.items():
+                new_obj[NameObject(name)] = self.copy(value)
+            return new_obj
+        if isinstance(obj, DictionaryObject):
+            new_obj = DictionaryObject()
+            for name, value in obj.items():
+                if name == "/Parent" and obj.get("/Type") == "/Page":
+                    continue
+                new_obj[NameObject(name)] = self.copy(value)
+            if obj.get("/Type") == "/Page" and key in self.page_keys:
+                new_obj[NameObject("/Parent")] = self.parent_ref
+            return new_obj
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copy(value) for value in obj)
+        return obj
+
+    def serialize(self):
+        """Yield (object id, serialized bytes) until every referenced object has been written"""
+        while self.pending:
+            obj_id, ref = self.pending.pop(0)
+            new_obj = self.copy(ref.get_object(), self._key(ref))
+            buffer = BytesIO()
+            buffer.write(f"{obj_id} 0 obj\n".encode())
+            new_obj.write_to_stream(buffer, None)
+            buffer.write(b"\nendobj\n")
+            yield obj_id, buffer.getvalue()
+
+
+def find_startxref(file_obj):
+    file_obj.seek(0, os.SEEK_END)
+    file_size = file_obj.tell()
+    file_obj.seek(max(0, file_size - 2048))
+    tail = file_obj.read()
+    position = tail.rfind(b"startxref")
+    if position < 0:
+        raise ValueError("Could not find startxref in the existing PDF")
+    return int(tail[position + len(b"startxref"):].split()[0])
+
+
+def write_xref_section(output_file, offsets):
+    # Always restate the head of the free list; some readers mis-number sections that do not start at 0
+    output_file.write(b"xref\n0 1\n0000000000 65535 f\r\n")
+    obj_ids = sorted(offsets)
+    start = 0
+    while start < len(obj_ids):
+        end = start
+        while end + 1 < len(obj_ids) and obj_ids[end + 1] == obj_ids[end] + 1:
+            end += 1
+        output_file.write(f"{obj_ids[start]} {end - start + 1}\n".encode())
+        for obj_id in obj_ids[start:end + 1]:
+            offset, generation = offsets[obj_id]
+            output_file.write(f"{offset:010d} {generation:05d} n\r\n".encode())
+        start = end + 1
+
+
+def append_pdfs(target_path, source_paths):
+    """Append pages to an existing PDF as an incremental update, leaving its current bytes untouched"""
+    # Open the target as a file object so PdfReader only reads the xref, trailer and page tree root
+    with open(target_path, "rb") as target_file:
+        target = PdfReader(target_file)
+        if target.is_encrypted:
+            raise ValueError("Cannot append to an encrypted PDF")
+        prev_xref = find_startxref(target_file)
+        trailer = target.trailer
+        pages_ref = trailer["/Root"].raw_get("/Pages")
+        pages = pages_ref.get_object()
+        kids = list(pages["/Kids"])
+        page_count = int(pages["/Count"])
+
+        parent_ref = IndirectObject(pages_ref.idnum, pages_ref.generation, None)
+        copier = PageObjectCopier(int(trailer["/Size"]), parent_ref)
+        for source_path in source_paths:
+            reader = read_pdf(source_path)
+            if reader.is_encrypted:
+                raise ValueError(f"Cannot append encrypted PDF: {os.path.basename(source_path)}")
+            for page in reader.pages:
+                kids.append(copier.add_page(page))
+                page_count += 1
+
+        new_pages = DictionaryObject(pages)
+        new_pages[NameObject("/Kids")] = ArrayObject(kids)
+        new_pages[NameObject("/Count")] = NumberObject(page_count)
+
+        new_trailer = DictionaryObject()
+        for name in ("/Root", "/Info", "/ID"):
+            if name in trailer:
+                new_trailer[NameObject(name)] = trailer.raw_get(name)
+
+        with open(target_path, "ab") as output_file:
+            target_file.seek(-1, os.SEEK_END)
+            if target_file.read(1) not in (b"\n", b"\r"):
+                output_file.write(b"\n")
+
+            offsets = {}
+            with span("write_objects", "pdf", path=target_path) as write_span:
+                for obj_id, data in copier.serialize():
+                    offsets[obj_id] = (output_file.tell(), 0)
+                    output_file.write(data)
+                write_span.set("objects", len(offsets))
+                write_span.set("bytes", output_file.tell())
+
+            offsets[pages_ref.idnum] = (output_file.tell(), pages_ref.generation)
+            output_file.write(f"{pages_ref.idnum} {pages_ref.generation} obj\n".encode())
+            new_pages.write_to_stream(output_file, None)
+            output_file.write(b"\nendobj\n")
+
+            xref_offset = output_file.tell()
+            write_xref_section(output_file, offsets)
+            new_trailer[NameObject("/Size")] = NumberObject(max(copier.next_id, int(trailer["/Size"])))
+            new_trailer[NameObject("/Prev")] = NumberObject(prev_xref)
+            output_file.write(b"trailer\n")
+            new_trailer.write_to_stream(output_file, None)
+            output_file.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+    return page_count
+
+
+MERGE_CATALOG_ID = 1
+MERGE_PAGES_ID = 2
+
+
+def _serialize_pdf_pages(job):
+    """Worker: parse one PDF and serialize its pages into object IDs starting at base_id"""
+    pdf_path, base_id = job
+    try:
+        reader = read_pdf(pdf_path)
+        if reader.is_encrypted:
+            raise ValueError("encrypted PDFs cannot be merged")
+        copier = PageObjectCopier(base_id, IndirectObject(MERGE_PAGES_ID, 0, None))
+        with span("serialize_pages", "pdf", path=pdf_path, pages=len(reader.pages)) as serialize_span:
+            page_ids = [copier.add_page(page).idnum for page in reader.pages]
+            chunks = []
+            offsets = []
+            position = 0
+            for obj_id, data in copier.serialize():
+                offsets.append((obj_id, position))
+                chunks.append(data)
+                position += len(data)
+            serialize_span.set("objects", len(offsets))
+            serialize_span.set("bytes", position)
+    except Exception as e:
+        raise PdfInputError(f"Failed to read {os.path.basename(pdf_path)}: {str(e)}")
+    # One bytes object pickles far faster than thousands of small ones
+    return page_ids, b"".join(chunks), offsets, copier.next_id
+
+
+def merge_pdf_files_parallel(pdf_paths, output_path, max_workers=None, object_counts=None):
+    """Merge PDFs, parsing and serializing the inputs in worker processes
+
+    Every input gets a disjoint object-ID range sized by its highest object number, so workers can
+    number objects independently. The parent only concatenates their bytes, in pdf_paths order.
+    object_counts (e.g. from PdfMetadataIndex) skips reading each trailer first.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        if object_counts is None:
+            with span("read_trailers", "pdf", files=len(pdf_paths)):
+                try:
+                    object_counts = [metadata["objects"] for metadata in executor.map(read_pdf_metadata, pdf_paths)]
+                except Exception as e:
+                    raise PdfInputError(f"Failed to read an input PDF: {str(e)}")
+
+        jobs = []
+        next_base = MERGE_PAGES_ID + 1
+        for pdf_path, object_count in zip(pdf_paths, object_counts):
+            jobs.append((pdf_path, next_base))
+            next_base += object_count
+
+        try:
+            with span("write", "pdf", path=output_path, files=len(pdf_paths)) as write_span, \
+                    open(output_path, "wb") as output_file:
+                output_file.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+                offsets = {}
+                kids = []
+                # Keep a bounded window of inputs in flight so finished results do not pile up in memory
+                window = max_workers * 2
+                futures = [executor.submit(_serialize_pdf_pages, job) for job in jobs[:window]]
+                for position in range(len(jobs)):
+                    page_ids, data, object_offsets, next_id = futures[position].result()
+                    futures[position] = None
+                    pdf_path, base_id = jobs[position]
+                    if next_id > base_id + object_counts[position]:
+                        # Its objects would collide with the next input's range
+                        raise PdfInputError(f"Failed to read {os.path.basename(pdf_path)}: it holds more objects "
+                                            f"than its cross-reference table declares")
+                    if position + window < len(jobs):
+                        futures.append(executor.submit(_serialize_pdf_pages, jobs[position + window]))
+
+                    start = output_file.tell()
+                    output_file.write(data)
+                    for obj_id, relative_offset in object_offsets:
+                        offsets[obj_id] = (start + relative_offset, 0)
+                    kids.extend(IndirectObject(page_id, 0, None) for page_id in page_ids)
+
+                pages = DictionaryObject()
+                pages[NameObject("/Type")] = NameObject("/Pages")
+                pages[NameObject("/Kids")] = ArrayObject(kids)
+                pages[NameObject("/Count")] = NumberObject(len(kids))
+                catalog = DictionaryObject()
+                catalog[NameObject("/Type")] = NameObject("/Catalog")
+                catalog[NameObject("/Pages")] = IndirectObject(MERGE_PAGES_ID, 0, None)
+                for obj_id, obj in ((MERGE_PAGES_ID, pages), (MERGE_CATALOG_ID, catalog)):
+                    offsets[obj_id] = (output_file.tell(), 0)
+                    output_file.write(f"{obj_id} 0 obj\n".encode())
+                    obj.write_to_stream(output_file, None)
+                    output_file.write(b"\nendobj\n")
+
+                xref_offset = output_file.tell()
+                write_xref_section(output_file, offsets)
+                trailer = DictionaryObject()
+                trailer[NameObject("/Size")] = NumberObject(max(offsets) + 1)
+                trailer[NameObject("/Root")] = IndirectObject(MERGE_CATALOG_ID, 0, None)
+                output_file.write(b"trailer\n")
+                trailer.write_to_stream(output_file, None)
+                output_file.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+                write_span.set("pages", len(kids))
+                write_span.set("bytes", output_file.tell())
+        except BaseException:
+            # Never leave a truncated merge behind under the requested name
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+    return len(kids)
+
+
+def _image_mode(xobj):
+    color_space = xobj.get("/ColorSpace")
+    if isinstance(color_space, ArrayObject) and color_space and color_space[0] == "/ICCBased":
+        return {1: "L", 3: "RGB"}.get(int(color_space[1].get_object().get("/N", 0)))
+    return SHRINK_COLOR_MODES.get(color_space)
+
+
+def _shrink_image(job):
+    """Decode, downsample and re-encode one image; runs in a worker process"""
+    width, height, mode, data, image_filter, decode_parms, scale, output_format, quality = job
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if image_filter == "/DCTDecode":
+        image = Image.open(BytesIO(data))
+        # Let libjpeg decode at a reduced scale when it can, which is much cheaper than a full decode
+        image.draft(mode, new_size)
+    else:
+        # The parent sends the still-compressed stream, so only the workers hold decoded pixels
+        if image_filter == "/FlateDecode":
+            data = FlateDecode.decode(data, decode_parms)
+        image = Image.frombytes(mode, (width, height), data)
+    if image.mode != mode:
+        image = image.convert(mode)
+    image = image.resize(new_size, Image.LANCZOS)
+
+    if output_format == "jpeg":
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        return new_size, "/DCTDecode", buffer.getvalue()
+    return new_size, "/FlateDecode", zlib.compress(image.tobytes(), 6)
+
+
+def _decode_parms(xobj):
+    """/DecodeParms as a plain picklable dict"""
+    parms = xobj.get("/DecodeParms")
+    if isinstance(parms, ArrayObject):
+        parms = parms[0] if parms else None
+    parms = parms.get_object() if parms is not None else None
+    if not isinstance(parms, DictionaryObject):
+        return None
+    return {str(key): int(value) for key, value in parms.items() if isinstance(value, NumberObject)}
+
+
+def _shrink_jobs(reader, target_dpi, output_format, quality):
+    """Yield (page_number, xobj, job) for every oversized image, without decoding any of them"""
+    seen = set()
+    for page_number, page in enumerate(reader.pages):
+        resources = page.get("/Resources")
+        xobjects = resources.get_object().get("/XObject") if resources else None
+        if not xobjects:
+            continue
+        page_width = float(page.mediabox.width) / 72
+        page_height = float(page.mediabox.height) / 72
+        for ref in xobjects.get_object().values():
+            if not isinstance(ref, IndirectObject) or ref.idnum in seen:
+                continue
+            seen.add(ref.idnum)
+            xobj = ref.get_object()
+            if xobj.get("/Subtype") != "/Image" or xobj.get("/ImageMask"):
+                continue
+            mode = _image_mode(xobj)
+            if mode is None or int(xobj.get("/BitsPerComponent", 8)) != 8:
+                continue
+
+            width, height = int(xobj["/Width"]), int(xobj["/Height"])
+            # Scans fill the page, so the page size is a good stand-in for the placed image size
+            dpi = max(width / page_width, height / page_height)
+            if dpi <= target_dpi * 1.1:
+                continue
+
+            image_filter = xobj.get("/Filter")
+            if isinstance(image_filter, ArrayObject) and len(image_filter) == 1:
+                image_filter = image_filter[0]
+            if image_filter not in ("/DCTDecode", "/FlateDecode", None):
+                continue
+            decode_parms = _decode_parms(xobj) if image_filter == "/FlateDecode" else None
+            yield page_number, xobj, (width, height, mode, xobj._data, image_filter, decode_parms,
+                                      target_dpi / dpi, output_format, quality)
+
+
+def shrink_pdf(input_path, output_path, target_dpi=150, output_format="jpeg", quality=75, max_workers=None):
+    """Downsample oversized images to target_dpi and report the bytes saved per page"""
+    if not PIL_AVAILABLE:
+        raise RuntimeError("Pillow is required to shrink PDFs: pip install Pillow")
+
+    started = time.perf_counter()
+    reader = read_pdf(input_path)
+    saved_per_page = [0] * len(reader.pages)
+    images = 0
+
+    def apply(page_number, xobj, result):
+        (new_width, new_height), new_filter, new_data = result
+        if len(new_data) >= len(xobj._data):
+            return
+        saved_per_page[page_number] += len(xobj._data) - len(new_data)
+        xobj._data = new_data
+        xobj.decoded_self = None
+        xobj[NameObject("/Filter")] = NameObject(new_filter)
+        xobj[NameObject("/Width")] = NumberObject(new_width)
+        xobj[NameObject("/Height")] = NumberObject(new_height)
+        xobj[NameObject("/BitsPerComponent")] = NumberObject(8)
+        if "/DecodeParms" in xobj:
+            del xobj["/DecodeParms"]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with span("recompress_images", "pdf") as recompress_span, \
+            ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Only a bounded window of images is in flight, so a scanned book never sits in memory at once
+        pending = {}
+        for page_number, xobj, job in _shrink_jobs(reader, target_dpi, output_format, quality):
+            if len(pending) >= max_workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    apply(*pending.pop(future), future.result())
+            pending[executor.submit(_shrink_image, job)] = (page_number, xobj)
+            images += 1
+        for future in as_completed(pending):
+            apply(*pending[future], future.result())
+        recompress_span.set("images", images)
+
+    write_pages(reader, range(len(reader.pages)), output_path)
+
+    elapsed = time.perf_counter() - started
+    input_size = os.path.getsize(input_path)
+    return {
+        "saved_per_page": saved_per_page,
+        "images": images,
+        "input_size": input_size,
+        "output_size": os.path.getsize(output_path),
+        "elapsed": elapsed,
+        "throughput_mb_s": input_size / (1024 * 1024) / elapsed if elapsed else 0.0,
+    }
+
+
+def _highest_object_number(reader):
+    """Largest object number in the cross-reference data, which a wrong trailer /Size can understate"""
+    numbers = [idnum for entries in reader.xref.values() for idnum in entries]
+    numbers.extend(reader.xref_objStm)
+    return max(numbers, default=0)
+
+
+def read_pdf_metadata(path):
+    """Read page count, version and encryption from the trailer and page tree root only"""
+    with open(path, "rb") as pdf_file:
+        header = pdf_file.read(1024)
+        version = re.search(rb"%PDF-(\d\.\d)", header)
+        pdf_file.seek(0)
+        # A file object (rather than a path) keeps PdfReader from loading the whole file into memory
+        reader = PdfReader(pdf_file)
+        trailer = reader.trailer
+        return {
+            "pages": int(trailer["/Root"]["/Pages"]["/Count"]),
+            "encrypted": "/Encrypt" in trailer,
+            "version": version.group(1).decode() if version else "?",
+            "objects": max(int(trailer["/Size"]), _highest_object_number(reader) + 1),
+        }
+
+
+class PdfMetadataIndex:
+    """On-disk cache of read_pdf_metadata results keyed by (path, size, mtime)"""
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path or os.path.join(CACHE_DIR, "metadata.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as cache_file:
+                self.entries = json.load(cache_file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, path):
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+
+        try:
+            with span("read_metadata", "pdf", path=path):
+                metadata = read_pdf_metadata(path)
+        except Exception as e:
+            metadata = {"error": str(e)}
+        metadata["size"] = stat.st_size
+
+        with self.lock:
+            # Drop entries for older versions of the same file
+            prefix = f"{os.path.abspath(path)}|"
+            for stale_key in [k for k in self.entries if k.startswith(prefix)]:
+                del self.entries[stale_key]
+            self.entries[key] = metadata
+        return metadata
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.entries)
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            cache_file.write(data)
+        os.replace(temp_path, self.cache_path)
+
+
+def tokenize(text):
+    return [term.lower() for term in TERM_PATTERN.findall(text)]
+
+
+# (path, mtime_ns, open file, reader) of the PDF the current worker process last read
+_worker_pdf = None
+
+
+def _worker_reader(path, mtime_ns):
+    """Reader for path, kept open across jobs so each worker parses a file's xref only once"""
+    global _worker_pdf
+    if _worker_pdf is None or _worker_pdf[:2] != (path, mtime_ns):
+        if _worker_pdf is not None:
+            _worker_pdf[2].close()
+        pdf_file = open(path, "rb")
+        # A file object keeps PdfReader from loading the whole file into memory
+        _worker_pdf = (path, mtime_ns, pdf_file, PdfReader(pdf_file))
+    return _worker_pdf[3]
+
+
+def _extract_page_terms(job):
+    """Extract the distinct terms of a chunk of pages; runs in a worker process"""
+    path, mtime_ns, page_numbers = job
+    reader = _worker_reader(path, mtime_ns)
+    return [(page_number, set(tokenize(reader.pages[page_number].extract_text() or "")))
+            for page_number in page_numbers]
+
+
+class PdfTextIndex:
+    """Persistent per-PDF inverted index (term -> page numbers), rebuilt only when a file changes"""
+
+    def __init__(self, index_dir=None, pages_per_job=16):
+        self.index_dir = index_dir or os.path.join(CACHE_DIR, "text_index")
+        self.pages_per_job = pages_per_job
+
+    def _index_path(self, path):
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.index_dir, f"{digest}.json")
+
+    def load(self, path):
+        """Return the stored index for path, or None if it is missing or stale"""
+        stat = os.stat(path)
+        try:
+            with open(self._index_path(path), "r", encoding="utf-8") as index_file:
+                entry = json.load(index_file)
+        except (OSError, ValueError):
+            return None
+        if entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime_ns:
+            return None
+        return entry
+
+    def update(self, paths, max_workers=None):
+        """Index every path whose stored index is missing or stale, in parallel across pages and files"""
+        stale = [path for path in paths if self.load(path) is None]
+        if not stale:
+            return 0
+
+        jobs = []
+        stats = {}
+        for path in stale:
+            stats[path] = os.stat(path)
+            with open(path, "rb") as pdf_file:
+                page_count = len(PdfReader(pdf_file).pages)
+            for start in range(0, page_count, self.pages_per_job):
+                jobs.append((path, stats[path].st_mtime_ns,
+                             list(range(start, min(start + self.pages_per_job, page_count)))))
+
+        terms = {path: {} for path in stale}
+        with span("extract_text", "pdf", files=len(stale), chunks=len(jobs)), \
+                ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for (path, _, _), pages in zip(jobs, executor.map(_extract_page_terms, jobs)):
+                for page_number, page_terms in pages:
+                    for term in page_terms:
+                        terms[path].setdefault(term, []).append(page_number)
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        for path in stale:
+            entry = {
+                "path": os.path.abspath(path),
+                "size": stats[path].st_size,
+                "mtime": stats[path].st_mtime_ns,
+                "terms": {term: sorted(pages) for term, pages in terms[path].items()},
+            }
+            index_path = self._index_path(path)
+            with open(f"{index_path}.tmp", "w", encoding="utf-8") as index_file:
+                json.dump(entry, index_file)
+            os.replace(f"{index_path}.tmp", index_path)
+        return len(stale)
+
+    def query(self, path, text):
+        """Return the sorted 0-based page numbers of path that contain every term in text"""
+        self.update([path])
+        entry = self.load(path)
+        query_terms = tokenize(text)
+        if entry is None or not query_terms:
+            return []
+        pages = set(entry["terms"].get(query_terms[0], []))
+        for term in query_terms[1:]:
+            pages &= set(entry["terms"].get(term, []))
+        return sorted(pages)
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
 
 class PDFSplitterApp:
     def __init__(self, root):
@@ -13,6 +738,12 @@ class PDFSplitterApp:
         # Store selected PDFs for merging
         self.selected_pdfs = []
 
+        # Page counts and sizes for the merge list are filled in by a background indexer
+        self.pdf_metadata = {}
+        self.metadata_index = PdfMetadataIndex()
+        self.index_executor = ThreadPoolExecutor(max_workers=4)
+        self.index_save_pending = False
+
         # Input file section
         self.input_frame = tk.LabelFrame(root, text="Input PDF", padx=10, pady=10)
         self.input_frame.pack(fill="x", padx=5, pady=5)
@@ -36,9 +767,48 @@ class PDFSplitterApp:
         self.end_page = tk.Entry(self.range_frame, width=10)
         self.end_page.pack(side="left", padx=5)
 
-        # Split button
-        self.split_button = tk.Button(root, text="Split PDF", command=self.split_pdf)
-        self.split_button.pack(pady=10)
+        # Split buttons
+        split_buttons_frame = tk.Frame(root)
+        split_buttons_frame.pack(pady=10)
+
+        self.split_button = tk.Button(split_buttons_frame, text="Split PDF", command=self.split_pdf)
+        self.split_button.pack(side="left", padx=5)
+
+        self.split_outline_button = tk.Button(split_buttons_frame, text="Split by Bookmarks",
+                                              command=self.split_by_bookmarks)
+        self.split_outline_button.pack(side="left", padx=5)
+
+        tk.Label(split_buttons_frame, text="Depth:").pack(side="left", padx=5)
+        self.outline_depth = tk.Entry(split_buttons_frame, width=5)
+        self.outline_depth.insert(0, "1")
+        self.outline_depth.pack(side="left", padx=5)
+
+        # Split pages matching a search
+        search_frame = tk.Frame(root)
+        search_frame.pack(pady=5)
+
+        tk.Label(search_frame, text="Pages containing:").pack(side="left", padx=5)
+        self.search_text = tk.Entry(search_frame, width=30)
+        self.search_text.pack(side="left", padx=5)
+
+        self.split_matching_button = tk.Button(search_frame, text="Split Matching Pages",
+                                               command=self.split_matching_pages)
+        self.split_matching_button.pack(side="left", padx=5)
+
+        # Shrink section
+        shrink_frame = tk.Frame(root)
+        shrink_frame.pack(pady=5)
+
+        tk.Label(shrink_frame, text="Target DPI:").pack(side="left", padx=5)
+        self.shrink_dpi = tk.Entry(shrink_frame, width=6)
+        self.shrink_dpi.insert(0, "150")
+        self.shrink_dpi.pack(side="left", padx=5)
+
+        self.shrink_format = tk.StringVar(value="jpeg")
+        tk.OptionMenu(shrink_frame, self.shrink_format, "jpeg", "flate").pack(side="left", padx=5)
+
+        self.shrink_button = tk.Button(shrink_frame, text="Shrink PDF", command=self.shrink_pdf)
+        self.shrink_button.pack(side="left", padx=5)
 
         # Separator
         separator = tk.Frame(root, height=2, bg="gray")
@@ -82,9 +852,16 @@ class PDFSplitterApp:
         self.move_down_button = tk.Button(order_frame, text="↓ Move Down", command=self.move_down)
         self.move_down_button.pack(side="left", padx=2)
 
+        # Merge summary
+        self.merge_summary_label = tk.Label(self.merge_frame, text="", anchor="w")
+        self.merge_summary_label.pack(fill="x", padx=5)
+
         self.merge_button = tk.Button(merge_buttons_frame, text="Merge PDFs", command=self.merge_pdfs)
         self.merge_button.pack(side="right", padx=5)
 
+        self.append_button = tk.Button(merge_buttons_frame, text="Append to...", command=self.append_to_existing)
+        self.append_button.pack(side="right", padx=5)
+
         # Status label
         self.status_label = tk.Label(root, text="", wraplength=500)
         self.status_label.pack(pady=10)
@@ -112,7 +889,7 @@ class PDFSplitterApp:
 
         try:
             # Create PDF reader object
-            reader = PdfReader(input_path)
+            reader = read_pdf(input_path)
             
             # Validate page range
             if start < 1 or end > len(reader.pages) or start > end:
@@ -120,22 +897,14 @@ class PDFSplitterApp:
                     f"Invalid page range. PDF has {len(reader.pages)} pages.")
                 return
 
-            # Create PDF writer object
-            writer = PdfWriter()
-
-            # Add specified pages to writer
-            for page_num in range(start - 1, end):
-                writer.add_page(reader.pages[page_num])
-
             # Generate output filename
             input_dir = os.path.dirname(input_path)
             input_filename = os.path.basename(input_path)
             output_filename = f"{os.path.splitext(input_filename)[0]}_pages_{start}_to_{end}.pdf"
             output_path = os.path.join(input_dir, output_filename)
 
-            # Write the output PDF
-            with open(output_path, "wb") as output_file:
-                writer.write(output_file)
+            # Write the specified pages to the output PDF
+            write_pages(reader, range(start - 1, end), output_path)
 
             self.status_label.config(
                 text=f"Success! New PDF saved as: {output_filename}",
@@ -146,6 +915,97 @@ class PDFSplitterApp:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
             self.status_label.config(text="Failed to split PDF", fg="red")
 
+    def split_by_bookmarks(self):
+        input_path = self.input_path.get()
+        if not input_path:
+            messagebox.showerror("Error", "Please select an input PDF file")
+            return
+
+        try:
+            depth = int(self.outline_depth.get())
+            if depth < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid bookmark depth (1 or more)")
+            return
+
+        try:
+            output_paths = split_by_outline(input_path, depth)
+            self.status_label.config(
+                text=f"Success! Split into {len(output_paths)} chapter files",
+                fg="green"
+            )
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            self.status_label.config(text="Failed to split PDF by bookmarks", fg="red")
+
+    def split_matching_pages(self):
+        input_path = self.input_path.get()
+        query = self.search_text.get().strip()
+        if not input_path:
+            messagebox.showerror("Error", "Please select an input PDF file")
+            return
+        if not tokenize(query):
+            messagebox.showerror("Error", "Please enter text to search for")
+            return
+
+        self.split_matching_button.config(state="disabled")
+        self.status_label.config(text="Indexing PDF text...", fg="black")
+        threading.Thread(target=self._split_matching_thread, args=(input_path, query), daemon=True).start()
+
+    def _split_matching_thread(self, input_path, query):
+        try:
+            pages = PdfTextIndex().query(input_path, query)
+            if not pages:
+                self.root.after(0, lambda: self.status_label.config(text=f"No pages contain: {query}", fg="red"))
+                return
+
+            slug = "_".join(tokenize(query))[:40]
+            output_filename = f"{os.path.splitext(os.path.basename(input_path))[0]}_matching_{slug}.pdf"
+            output_path = os.path.join(os.path.dirname(input_path), output_filename)
+            write_pages(read_pdf(input_path), pages, output_path)
+            self.root.after(0, lambda: self.status_label.config(
+                text=f"Success! {len(pages)} matching pages saved as: {output_filename}", fg="green"))
+        except Exception as e:
+            self.root.after(0, lambda e=e: messagebox.showerror("Error", f"An error occurred: {str(e)}"))
+            self.root.after(0, lambda: self.status_label.config(text="Failed to split matching pages", fg="red"))
+        finally:
+            self.root.after(0, lambda: self.split_matching_button.config(state="normal"))
+
+    def shrink_pdf(self):
+        input_path = self.input_path.get()
+        if not input_path:
+            messagebox.showerror("Error", "Please select an input PDF file")
+            return
+
+        try:
+            target_dpi = int(self.shrink_dpi.get())
+            if target_dpi < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid target DPI")
+            return
+
+        output_filename = f"{os.path.splitext(os.path.basename(input_path))[0]}_shrunk.pdf"
+        output_path = os.path.join(os.path.dirname(input_path), output_filename)
+
+        try:
+            report = shrink_pdf(input_path, output_path, target_dpi, self.shrink_format.get())
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            self.status_label.config(text="Failed to shrink PDF", fg="red")
+            return
+
+        saved_pages = [(number, saved) for number, saved in enumerate(report["saved_per_page"], 1) if saved]
+        details = "\n".join(f"Page {number}: {saved / 1024:.1f} KB saved" for number, saved in saved_pages[:20])
+        if len(saved_pages) > 20:
+            details += f"\n... and {len(saved_pages) - 20} more pages"
+        total_saved = report["input_size"] - report["output_size"]
+        summary = (f"Recompressed {report['images']} images, saved {total_saved / (1024 * 1024):.1f} MB "
+                   f"in {report['elapsed']:.1f}s ({report['throughput_mb_s']:.1f} MB/s)")
+        self.status_label.config(text=f"Success! {summary}\nSaved as: {output_filename}", fg="green")
+        messagebox.showinfo("Success", f"{summary}\n\n{details}" if details else summary)
+
     def browse_merge_files(self):
         filenames = filedialog.askopenfilenames(
             title="Select PDF files to merge",
@@ -155,7 +1015,62 @@ class PDFSplitterApp:
             for filename in filenames:
                 if filename not in self.selected_pdfs:
                     self.selected_pdfs.append(filename)
-                    self.pdf_listbox.insert(tk.END, os.path.basename(filename))
+                    self.pdf_listbox.insert(tk.END, self.format_pdf_entry(filename))
+                    self.index_executor.submit(self.index_pdf, filename)
+            self.update_merge_summary()
+
+    def index_pdf(self, path):
+        # Runs on an indexer thread; hand the result back to the Tk thread
+        metadata = self.metadata_index.get(path)
+        self.root.after(0, self.on_metadata_ready, path, metadata)
+
+    def on_metadata_ready(self, path, metadata):
+        self.pdf_metadata[path] = metadata
+        if path in self.selected_pdfs:
+            index = self.selected_pdfs.index(path)
+            was_selected = self.pdf_listbox.selection_includes(index)
+            self.pdf_listbox.delete(index)
+            self.pdf_listbox.insert(index, self.format_pdf_entry(path))
+            if was_selected:
+                self.pdf_listbox.selection_set(index)
+        self.update_merge_summary()
+
+        if not self.index_save_pending:
+            self.index_save_pending = True
+            self.root.after(1000, self.save_metadata_index)
+
+    def save_metadata_index(self):
+        self.index_save_pending = False
+        try:
+            self.metadata_index.save()
+        except OSError:
+            pass
+
+    def format_pdf_entry(self, path):
+        name = os.path.basename(path)
+        metadata = self.pdf_metadata.get(path)
+        if metadata is None:
+            return f"{name}  (indexing...)"
+        if "error" in metadata:
+            return f"{name}  (unreadable: {metadata['error']})"
+        details = f"{metadata['pages']} pages, {format_size(metadata['size'])}, PDF {metadata['version']}"
+        if metadata["encrypted"]:
+            details += ", encrypted"
+        return f"{name}  ({details})"
+
+    def update_merge_summary(self):
+        indexed = [self.pdf_metadata[path] for path in self.selected_pdfs
+                   if path in self.pdf_metadata and "error" not in self.pdf_metadata[path]]
+        if not self.selected_pdfs:
+            self.merge_summary_label.config(text="")
+            return
+        total_pages = sum(metadata["pages"] for metadata in indexed)
+        total_size = sum(metadata["size"] for metadata in indexed)
+        text = (f"{len(self.selected_pdfs)} files, {total_pages} pages, "
+                f"estimated output ~{format_size(total_size)}")
+        if len(indexed) < len(self.selected_pdfs):
+            text += f" ({len(self.selected_pdfs) - len(indexed)} not indexed)"
+        self.merge_summary_label.config(text=text)
 
     def remove_selected(self):
         selected_indices = self.pdf_listbox.curselection()
@@ -163,10 +1078,12 @@ class PDFSplitterApp:
         for index in reversed(selected_indices):
             self.pdf_listbox.delete(index)
             del self.selected_pdfs[index]
+        self.update_merge_summary()
 
     def clear_all(self):
         self.pdf_listbox.delete(0, tk.END)
         self.selected_pdfs.clear()
+        self.update_merge_summary()
 
     def move_up(self):
         selected_indices = list(self.pdf_listbox.curselection())
@@ -228,23 +1145,16 @@ class PDFSplitterApp:
             if not output_path:
                 return
 
-            # Create PDF writer object
-            writer = PdfWriter()
-
-            # Merge all PDFs
-            for pdf_path in self.selected_pdfs:
-                try:
-                    reader = PdfReader(pdf_path)
-                    # Add all pages from this PDF
-                    for page in reader.pages:
-                        writer.add_page(page)
-                except Exception as e:
-                    messagebox.showerror("Error", f"Failed to read {os.path.basename(pdf_path)}: {str(e)}")
-                    return
-
-            # Write the merged PDF
-            with open(output_path, "wb") as output_file:
-                writer.write(output_file)
+            # Object counts from the index let the workers start without re-reading each trailer
+            indexed = [self.pdf_metadata.get(path) or {} for path in self.selected_pdfs]
+            object_counts = None
+            if all("objects" in metadata for metadata in indexed):
+                object_counts = [metadata["objects"] for metadata in indexed]
+            try:
+                merge_pdf_files_parallel(self.selected_pdfs, output_path, object_counts=object_counts)
+            except PdfInputError as e:
+                messagebox.showerror("Error", str(e))
+                return
 
             output_filename = os.path.basename(output_path)
             self.status_label.config(
@@ -257,7 +1167,34 @@ class PDFSplitterApp:
             messagebox.showerror("Error", f"An error occurred while merging: {str(e)}")
             self.status_label.config(text="Failed to merge PDFs", fg="red")
 
+    def append_to_existing(self):
+        if not self.selected_pdfs:
+            messagebox.showerror("Error", "Please select at least 1 PDF file to append")
+            return
+
+        target_path = filedialog.askopenfilename(
+            title="Select existing PDF to append to",
+            filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
+        )
+        if not target_path:
+            return
+        if target_path in self.selected_pdfs:
+            messagebox.showerror("Error", "The target PDF cannot also be in the list to append")
+            return
+
+        try:
+            page_count = append_pdfs(target_path, self.selected_pdfs)
+            target_filename = os.path.basename(target_path)
+            self.status_label.config(
+                text=f"Success! Appended {len(self.selected_pdfs)} PDFs to {target_filename} ({page_count} pages)",
+                fg="green"
+            )
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while appending: {str(e)}")
+            self.status_label.config(text="Failed to append PDFs", fg="red")
+
 if __name__ == "__main__":
+    enable_from_argv(sys.argv)
     root = tk.Tk()
     app = PDFSplitterApp(root)
     root.mainloop()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Remux Planner
+处理前预估输出大小和耗时，并检查磁盘剩余空间（不写任何输出文件）
+
+Usage:
+  python remux_planner.py <video_file>... --keep-lang jpn,eng [--drop-title commentary] [--transcode dts=aac:192k:2]
+  python remux_planner.py --measure <dir>       # Re-measure the disk throughput of <dir>'s device
+
+Stream sizes come from the probe data (per-stream bit_rate, or the BPS/NUMBER_OF_BYTES
+statistics tags mkvmerge writes) times the duration. Streams without either are sized
+by summing their packet sizes, which reads the whole file once. Times come from a
+per-device read/write throughput profile cached in ~/.cache/audio_track_remover/throughput.json.
+Measuring writes a 64 MB sample file, so it only happens with --measure; devices that
+were never measured use a conservative default.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from audio_track_remover import (DEFAULT_BITRATES, actions_from_rules, get_video_info, list_audio_tracks,
+                                 parse_transcode_rules, select_tracks_by_policy)
+from ffmpeg_engine import get_engine
+from tracing import span
+
+PROFILE_PATH = Path.home() / '.cache' / 'audio_track_remover' / 'throughput.json'
+PROFILE_SAMPLE_BYTES = 64 * 1024 * 1024
+# Roughly a single hard disk; used for devices that were never measured
+DEFAULT_THROUGHPUT = {'read_mb_s': 120.0, 'write_mb_s': 100.0}
+# Output size of a remux beyond the streams themselves (container headers, index, cues)
+CONTAINER_OVERHEAD = 0.005
+# How many times faster than real time each encoder runs on one core, roughly
+ENCODE_SPEED = {'aac': 150, 'opus': 100, 'ac3': 300, 'eac3': 200, 'flac': 400}
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def _tag(stream, name):
+    # mkvmerge writes e.g. BPS or BPS-eng; ffmpeg's matroska muxer writes neither
+    for key, value in stream.get('tags', {}).items():
+        if key.upper() == name or key.upper().startswith(name + '-'):
+            return value
+    return None
+
+
+def stream_bytes_from_probe(stream, duration):
+    """Estimated size of a stream in bytes, or None when the probe data does not say"""
+    number_of_bytes = _tag(stream, 'NUMBER_OF_BYTES')
+    if number_of_bytes and number_of_bytes.isdigit():
+        return int(number_of_bytes)
+    bit_rate = stream.get('bit_rate') or _tag(stream, 'BPS')
+    stream_duration = float(stream.get('duration') or duration or 0)
+    if bit_rate and str(bit_rate).isdigit() and stream_duration:
+        return int(bit_rate) * stream_duration / 8
+    return None
+
+
+def scan_packet_sizes(file_path):
+    """Sum packet sizes per stream index with ffprobe (reads the whole file)"""
+    totals = {}
+
+    def on_line(line):
+        stream_index, _, size = line.partition(',')
+        if stream_index.isdigit() and size.strip().isdigit():
+            totals[int(stream_index)] = totals.get(int(stream_index), 0) + int(size)
+
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'packet=stream_index,size', '-of', 'csv=p=0', str(file_path)]
+    with span('packet_scan', 'plan', path=str(file_path)):
+        result = get_engine().run(cmd, on_stdout_line=on_line)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe packet scan failed: {result.stderr.strip()}")
+    return totals
+
+
+class ThroughputProfile:
+    """Sequential read/write MB/s per storage device, measured once and cached"""
+
+    def __init__(self, path=PROFILE_PATH):
+        self.path = Path(path)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as profile_file:
+                self.devices = json.load(profile_file)
+        except (OSError, ValueError):
+            self.devices = {}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as profile_file:
+            json.dump(self.devices, profile_file, indent=2)
+
+    def measure(self, directory):
+        """Write, fsync, drop from the page cache and read back a sample file in directory"""
+        directory = Path(directory)
+        sample_path = directory / f".throughput_probe_{os.getpid()}"
+        block = os.urandom(1024 * 1024)
+        try:
+            with span('measure_throughput', 'plan', directory=str(directory)):
+                start = time.perf_counter()
+                fd = os.open(sample_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                try:
+                    for _ in range(PROFILE_SAMPLE_BYTES // len(block)):
+                        os.write(fd, block)
+                    os.fsync(fd)
+                    write_seconds = time.perf_counter() - start
+                    if hasattr(os, 'posix_fadvise'):
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
+
+                start = time.perf_counter()
+                with open(sample_path, 'rb', buffering=0) as sample_file:
+                    while sample_file.read(len(block)):
+                        pass
+                read_seconds = time.perf_counter() - start
+        finally:
+            if sample_path.exists():
+                sample_path.unlink()
+
+        megabytes = PROFILE_SAMPLE_BYTES / 1024 / 1024
+        entry = {
+            'directory': str(directory.resolve()),
+            'read_mb_s': round(megabytes / max(read_seconds, 1e-6), 1),
+            'write_mb_s': round(megabytes / max(write_seconds, 1e-6), 1),
+            'measured_at': time.time(),
+        }
+        self.devices[str(os.stat(directory).st_dev)] = entry
+        self.save()
+        return entry
+
+    def for_directory(self, directory):
+        """Throughput entry for the device holding directory, or DEFAULT_THROUGHPUT if it was never measured"""
+        entry = self.devices.get(str(os.stat(directory).st_dev))
+        return entry or dict(DEFAULT_THROUGHPUT, directory=str(directory), default=True)
+
+
+def estimate_output_bytes(file_path, video_info, tracks_to_keep, track_actions=None, scan_packets=True):
+    """Return (output bytes, encode seconds, method) for keeping tracks_to_keep of file_path
+
+    method is 'bitrate', 'packets' (needed a packet scan) or 'incomplete' (unknown streams counted as 0).
+    """
+    track_actions = track_actions or {}
+    audio_tracks = list_audio_tracks(video_info)
+    duration = float(video_info.get('format', {}).get('duration') or 0)
+    streams = video_info.get('streams', [])
+    # Invalid indices are reported by the remux itself; they add nothing to the estimate
+    tracks_to_keep = [i for i in tracks_to_keep if 0 <= i < len(audio_tracks)]
+
+    kept_stream_indices = {audio_tracks[i]['stream_index'] for i in tracks_to_keep}
+    output_streams = [stream for stream in streams
+                      if stream.get('codec_type') in ('video', 'subtitle')
+                      or stream.get('index') in kept_stream_indices]
+
+    sizes = {stream.get('index'): stream_bytes_from_probe(stream, duration) for stream in streams}
+    method = 'bitrate'
+    if any(sizes[stream.get('index')] is None for stream in output_streams):
+        if scan_packets:
+            method = 'packets'
+            sizes.update(scan_packet_sizes(file_path))
+        else:
+            method = 'incomplete'
+
+    output_bytes = 0
+    encode_seconds = 0
+    transcoded = {audio_tracks[i]['stream_index']: (audio_tracks[i], action)
+                  for i, action in track_actions.items() if action and i in tracks_to_keep}
+    for stream in output_streams:
+        if stream.get('index') in transcoded:
+            track, action = transcoded[stream.get('index')]
+            channels = action['channels'] or (track['channels'] if track['channels'] != 'unknown' else 2)
+            kbps = int(action['bitrate'].rstrip('k')) if action['bitrate'] else \
+                DEFAULT_BITRATES.get(action['codec'], 0) * int(channels)
+            if not kbps:
+                # Lossless target: assume it stays about the size of the source
+                kbps = (sizes.get(stream.get('index')) or 0) * 8 / 1000 / max(duration, 1)
+            output_bytes += kbps * 1000 / 8 * duration
+            encode_seconds += duration / ENCODE_SPEED.get(action['codec'], 100)
+        else:
+            output_bytes += sizes.get(stream.get('index')) or 0
+    return int(output_bytes * (1 + CONTAINER_OVERHEAD)), encode_seconds, method
+
+
+def plan_file(file_path, output_file, tracks_to_keep, track_actions=None, video_info=None,
+              profile=None, scan_packets=True):
+    """Estimate output size and processing time of one remux without running it
+
+    output_file only needs its directory to exist; pass the staging path when outputs are staged.
+    """
+    file_path = Path(file_path)
+    output_file = Path(output_file)
+    video_info = video_info or get_video_info(file_path)
+    if not video_info:
+        raise RuntimeError(f"Failed to get video info: {file_path}")
+    output_bytes, encode_seconds, method = estimate_output_bytes(
+        file_path, video_info, tracks_to_keep, track_actions, scan_packets)
+
+    input_bytes = file_path.stat().st_size
+    output_dir = output_file.parent
+    profile = profile or ThroughputProfile()
+    source = profile.for_directory(file_path.parent)
+    target = profile.for_directory(output_dir)
+    read_seconds = input_bytes / 1024 / 1024 / source['read_mb_s']
+    write_seconds = output_bytes / 1024 / 1024 / target['write_mb_s']
+    if os.stat(file_path.parent).st_dev == os.stat(output_dir).st_dev:
+        # One device serves both streams, so reads and writes take turns
+        io_seconds = read_seconds + write_seconds
+    else:
+        io_seconds = max(read_seconds, write_seconds)
+
+    return {
+        'input': str(file_path),
+        'output': str(output_file),
+        'input_bytes': input_bytes,
+        'output_bytes': output_bytes,
+        'seconds': max(io_seconds, encode_seconds),
+        'method': method,
+        'default_throughput': source.get('default', False) or target.get('default', False),
+    }
+
+
+def check_free_space(plans):
+    """Return (directory, needed, free) for every output device without room for its planned outputs"""
+    needed = {}
+    for plan in plans:
+        output_dir = Path(plan['output']).parent
+        device = os.stat(output_dir).st_dev
+        directory, total = needed.get(device, (output_dir, 0))
+        needed[device] = (directory, total + plan['output_bytes'])
+
+    shortfalls = []
+    for directory, total in needed.values():
+        free = shutil.disk_usage(directory).free
+        if total > free:
+            shortfalls.append((directory, total, free))
+    return shortfalls
+
+
+def print_plans(plans):
+    print(f"{'Input':<50} {'Input size':>11} {'Output size':>11} {'Time':>9}")
+    for plan in plans:
+        name = os.path.basename(plan['input'])
+        name = name if len(name) <= 50 else name[:47] + '...'
+        estimate = '' if plan['method'] == 'bitrate' else ' (from packet scan)'
+        print(f"{name:<50} {format_bytes(plan['input_bytes']):>11} {format_bytes(plan['output_bytes']):>11} "
+              f"{format_duration(plan['seconds']):>9}{estimate}")
+
+    total_input = sum(plan['input_bytes'] for plan in plans)
+    total_output = sum(plan['output_bytes'] for plan in plans)
+    total_seconds = sum(plan['seconds'] for plan in plans)
+    print(f"\n{len(plans)} file(s): {format_bytes(total_input)} -> {format_bytes(total_output)} "
+          f"(saves {format_bytes(max(total_input - total_output, 0))}), about {format_duration(total_seconds)}")
+
+    if any(plan.get('default_throughput') for plan in plans):
+        print("Times assume a default disk speed; run 'remux_planner.py --measure <dir>' for measured ones")
+
+    shortfalls = check_free_space(plans)
+    for directory, total, free in shortfalls:
+        print(f"Not enough free space in {directory}: needs {format_bytes(total)}, {format_bytes(free)} free")
+    return not shortfalls
+
+
+def plan_with_policy(file_paths, keep_languages, drop_title_patterns, transcode_rules=None,
+                     output_dir=None, profile=None):
+    """Plan a batch the way --batch would process it; files the policy would skip are left out"""
+    profile = profile or ThroughputProfile()
+    plans = []
+    for file_path in file_paths:
+        file_path = Path(file_path)
+        video_info = get_video_info(file_path) if file_path.exists() else None
+        if not video_info:
+            print(f"Skipping (cannot probe): {file_path}")
+            continue
+        audio_tracks = list_audio_tracks(video_info)
+        tracks_to_keep = select_tracks_by_policy(audio_tracks, keep_languages, drop_title_patterns)
+        track_actions = actions_from_rules(audio_tracks, tracks_to_keep, transcode_rules or {})
+        if not tracks_to_keep or (len(tracks_to_keep) == len(audio_tracks) and not track_actions):
+            print(f"Skipping (nothing to do): {file_path}")
+            continue
+        output_file = Path(output_dir or file_path.parent) / f"{file_path.stem}_cleaned{file_path.suffix}"
+        plans.append(plan_file(file_path, output_file, tracks_to_keep, track_actions, video_info, profile))
+    return plans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Estimate output size and time of an audio track removal')
+    parser.add_argument('files', nargs='*', help='Video files')
+    parser.add_argument('--keep-lang', default='', help='Comma-separated languages to keep (e.g. jpn,eng)')
+    parser.add_argument('--drop-title', default='', help='Comma-separated title fragments to drop')
+    parser.add_argument('--transcode', default='', help='Convert kept tracks by source codec, e.g. dts=aac:192k:2')
+    parser.add_argument('--output-dir', help='Where the cleaned files would be written')
+    parser.add_argument('--measure', metavar='DIR', help="Re-measure the throughput of DIR's device")
+    args = parser.parse_args(argv)
+
+    profile = ThroughputProfile()
+    if args.measure:
+        try:
+            entry = profile.measure(args.measure)
+        except OSError as e:
+            print(f"Cannot measure {args.measure}: {e}", file=sys.stderr)
+            return 1
+        print(f"{args.measure}: read {entry['read_mb_s']} MB/s, write {entry['write_mb_s']} MB/s")
+        if not args.files:
+            return 0
+    if not args.files:
+        parser.error('no video files given')
+
+    keep_languages = [lang.strip() for lang in args.keep_lang.split(',') if lang.strip()]
+    drop_title_patterns = [title.strip() for title in args.drop_title.split(',') if title.strip()]
+    try:
+        transcode_rules = parse_transcode_rules(args.transcode)
+    except ValueError as e:
+        parser.error(str(e))
+
+    plans = plan_with_policy(args.files, keep_languages, drop_title_patterns, transcode_rules,
+                             args.output_dir, profile)
+    if not plans:
+        print("Nothing to process")
+        return 0
+    return 0 if print_plans(plans) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
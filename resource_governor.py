@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resource Governor
+所有媒体子进程共用的CPU线程预算、后台优先级（nice/ionice）和按磁盘的I/O并发令牌
+
+The ffmpeg engine admits every child process here before starting it:
+
+  - Thread budget: encoding jobs (a non-copy codec or a filter) reserve a share of
+    the budget and get it as -threads, so concurrent encodes never add up to more
+    threads than the budget. Stream copies and probes reserve no threads.
+  - I/O tokens: a job holds one token for every device its inputs and outputs live on,
+    so only a few jobs stream from or to the same disk at once. Probes need none.
+  - Priority: in the background class children run under nice/ionice (or with a
+    below-normal priority class on Windows), leaving the box responsive.
+
+Configure it with environment variables or flags accepted by every tool:
+
+  PYTHON_TOOLS_THREADS=8 PYTHON_TOOLS_PRIORITY=background python watch_folder.py ...
+  python audio_track_remover.py --batch *.mkv --keep-lang jpn --threads 8 --io-tokens 1 --background
+
+Work that does not run through the engine (e.g. MoviePy) reserves the same way:
+
+    with get_engine().reserve([input_path, output_path]) as admission:
+        clip.write_videofile(output_path, threads=admission.threads)
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+THREADS_ENV_VAR = 'PYTHON_TOOLS_THREADS'
+IO_TOKENS_ENV_VAR = 'PYTHON_TOOLS_IO_TOKENS'
+PRIORITY_ENV_VAR = 'PYTHON_TOOLS_PRIORITY'
+PRIORITIES = ('normal', 'background')
+
+# Encoders scale well up to about this many threads; more jobs share the budget instead
+JOB_THREADS = 4
+IO_TOKENS_PER_DEVICE = 2
+BACKGROUND_NICENESS = 10
+# Best-effort class at its lowest level; the idle class can starve a job completely
+BACKGROUND_IONICE = ['-c', '2', '-n', '7']
+
+CODEC_OPTIONS = ('-c', '-codec', '-vcodec', '-acodec', '-scodec')
+FILTER_OPTIONS = ('-vf', '-af', '-filter', '-filter_complex', '-lavfi')
+# ffmpeg options that take no value; every other option is followed by one
+FLAG_OPTIONS = ('-y', '-n', '-nostats', '-stats', '-nostdin', '-hide_banner', '-shortest',
+                '-vn', '-an', '-sn', '-dn', '-re', '-copyts', '-benchmark')
+
+Admission = namedtuple('Admission', ['threads', 'cpu_threads', 'devices'])
+NO_RESERVATION = Admission(0, 0, ())
+
+
+def _program(cmd):
+    return os.path.basename(str(cmd[0])).lower()
+
+
+def is_ffmpeg(cmd):
+    return _program(cmd).startswith('ffmpeg')
+
+
+def is_encode(cmd):
+    """True when an ffmpeg command decodes and encodes rather than only copying streams"""
+    has_codec = False
+    for option, value in zip(cmd, cmd[1:]):
+        name = str(option).split(':')[0]
+        if name in FILTER_OPTIONS:
+            return True
+        if name in CODEC_OPTIONS:
+            has_codec = True
+            if str(value) != 'copy':
+                return True
+    # Without any codec option ffmpeg transcodes with its default encoders
+    return not has_codec
+
+
+def io_paths_of(cmd):
+    """Local files an ffmpeg command reads (-i) and writes (its last argument)"""
+    args = [str(arg) for arg in cmd]
+    paths = [value for option, value in zip(args, args[1:]) if option == '-i']
+    if paths:
+        paths.append(args[-1])
+    return [path for path in paths if path != '-' and not path.startswith('pipe:') and '://' not in path]
+
+
+def device_of(path):
+    """st_dev of the filesystem holding path, walking up to the first directory that exists"""
+    path = Path(os.path.abspath(path))
+    while not path.exists() and path.parent != path:
+        path = path.parent
+    return os.stat(path).st_dev
+
+
+def limit_threads(cmd, threads):
+    """Give every input and every output of an ffmpeg command -threads <threads>
+
+    -threads is a per-file option, so each output (the encoders that use the CPU) needs
+    its own; any -threads already in the command is replaced.
+    """
+    value = str(threads)
+    limited = [cmd[0]]
+    position = 1
+    while position < len(cmd):
+        arg = cmd[position]
+        if arg == '-threads':
+            position += 2
+            continue
+        if arg == '-i':
+            limited += ['-threads', value] + cmd[position:position + 2]
+            position += 2
+        elif arg.startswith('-') and arg != '-':
+            # Options take one value except ffmpeg's boolean flags
+            width = 1 if arg.split(':')[0] in FLAG_OPTIONS else 2
+            limited += cmd[position:position + width]
+            position += width
+        else:
+            # Anything that is neither an option nor its value is an output file
+            limited += ['-threads', value, arg]
+            position += 1
+    return limited
+
+
+class ResourceGovernor:
+    """Thread, I/O and priority limits shared by every child process of one tool
+
+    admit()/admit_command() and release() run on the engine's event loop.
+    """
+
+    def __init__(self, thread_budget=None, io_tokens=None, priority=None, job_threads=None):
+        self.thread_budget = 0
+        self.io_tokens = 0
+        self.priority = 'normal'
+        self.job_threads = job_threads
+        self.configure(thread_budget or int(os.environ.get(THREADS_ENV_VAR) or 0) or os.cpu_count() or 1,
+                       io_tokens or int(os.environ.get(IO_TOKENS_ENV_VAR) or 0) or IO_TOKENS_PER_DEVICE,
+                       priority or os.environ.get(PRIORITY_ENV_VAR) or 'normal')
+        self._reserved_threads = 0
+        self._device_jobs = {}
+        self._waiters = []
+
+    def configure(self, thread_budget=None, io_tokens=None, priority=None):
+        if priority is not None and priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}' (choose from {', '.join(PRIORITIES)})")
+        self.thread_budget = max(1, thread_budget or self.thread_budget)
+        self.io_tokens = max(1, io_tokens or self.io_tokens)
+        self.priority = priority or self.priority
+
+    @property
+    def threads_per_job(self):
+        return max(1, min(self.thread_budget, self.job_threads or JOB_THREADS))
+
+    def _fits(self, cpu_threads, devices):
+        if cpu_threads and self._reserved_threads + cpu_threads > self.thread_budget:
+            return False
+        return all(self._device_jobs.get(device, 0) < self.io_tokens for device in devices)
+
+    async def admit(self, io_paths=(), encode=True):
+        """Wait until the budget has room, then reserve threads and a token on each device"""
+        cpu_threads = self.threads_per_job if encode else 0
+        devices = tuple(sorted({device_of(path) for path in io_paths}))
+        if not cpu_threads and not devices:
+            return Admission(1, 0, ())
+        loop = asyncio.get_running_loop()
+        while not self._fits(cpu_threads, devices):
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self._reserved_threads += cpu_threads
+        for device in devices:
+            self._device_jobs[device] = self._device_jobs.get(device, 0) + 1
+        return Admission(cpu_threads or 1, cpu_threads, devices)
+
+    async def admit_command(self, cmd, io_paths=None):
+        if not is_ffmpeg(cmd) or '-i' not in cmd:
+            # Probes read little more than headers and are never throttled, nor is 'ffmpeg -version'
+            return NO_RESERVATION
+        if io_paths is None:
+            io_paths = io_paths_of(cmd)
+        return await self.admit(io_paths, is_encode(cmd))
+
+    def release(self, admission):
+        if not admission.cpu_threads and not admission.devices:
+            return
+        self._reserved_threads -= admission.cpu_threads
+        for device in admission.devices:
+            self._device_jobs[device] -= 1
+        # Every waiter checks again; the ones that still do not fit wait for the next release
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def launch(self, cmd, admission):
+        """Return (cmd, Popen keyword arguments) applying the admission and the priority class"""
+        cmd = [str(arg) for arg in cmd]
+        if admission.threads and is_ffmpeg(cmd):
+            cmd = limit_threads(cmd, admission.threads)
+        popen_kwargs = {}
+        if self.priority == 'background':
+            if os.name == 'nt':
+                popen_kwargs['creationflags'] = subprocess.BELOW_NORMAL_PRIORITY_CLASS
+            else:
+                # nice and ionice exec the command, so the child keeps the same pid
+                prefix = []
+                if shutil.which('nice'):
+                    prefix += ['nice', '-n', str(BACKGROUND_NICENESS)]
+                if shutil.which('ionice'):
+                    prefix += ['ionice'] + BACKGROUND_IONICE
+                cmd = prefix + cmd
+        return cmd, popen_kwargs
+
+
+def configure_from_argv(argv):
+    """Handle and remove '--threads N', '--io-tokens N' and '--background' from argv in place"""
+    options = {'--threads': 'thread_budget', '--io-tokens': 'io_tokens'}
+    settings = {}
+    for flag, name in options.items():
+        if flag in argv:
+            position = argv.index(flag)
+            if position + 1 < len(argv) and argv[position + 1].isdigit():
+                settings[name] = int(argv[position + 1])
+                del argv[position:position + 2]
+            else:
+                del argv[position]
+    if '--background' in argv:
+        argv.remove('--background')
+        settings['priority'] = 'background'
+    if settings:
+        get_governor().configure(**settings)
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Return the process-wide governor used by the ffmpeg engine"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = ResourceGovernor()
+        return _governor
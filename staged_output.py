@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Staged Output
+先写到临时文件（可放在单独的暂存盘上），fsync后再原子地发布到最终位置
+
+A crash or a full disk never leaves a truncated file under the final name:
+
+    staged_path = staging_path_for(final_path, staging_dir)
+    ensure_free_space(estimated_bytes, final_path.parent, staging_dir)
+    ...write staged_path...
+    publish(staged_path, final_path)   # fsync, then rename (or copy + rename across devices)
+
+Temporary names keep the real extension, since ffmpeg picks the container from it.
+They also carry the writer's host, pid and a per-call token, so concurrent jobs never
+share one, and clean_stale_partials() removes those left behind by processes on this
+machine that died; staging directories may be shared with other hosts.
+"""
+
+import os
+import re
+import shutil
+import socket
+import uuid
+from pathlib import Path
+
+from tracing import span
+
+PARTIAL_MARKER = '.partial'
+PARTIAL_NAME = re.compile(r'^\..*\.partial-(?P<host>[A-Za-z0-9_-]+)-(?P<pid>\d+)-[0-9a-f]{32}(?:\.[^.]*)?$')
+# Headroom on top of the estimate: container index, filesystem metadata, estimate error
+SPACE_MARGIN_BYTES = 64 * 1024 * 1024
+SPACE_MARGIN_RATIO = 0.02
+COPY_BUFFER_BYTES = 8 * 1024 * 1024
+
+
+class InsufficientSpaceError(OSError):
+    pass
+
+
+def _host_tag():
+    """This machine's hostname, reduced to characters that are safe in a file name"""
+    return re.sub(r'[^A-Za-z0-9_-]', '_', socket.gethostname()) or 'localhost'
+
+
+def staging_path_for(final_path, staging_dir=None):
+    """New hidden temporary name for final_path, in staging_dir or next to the final file"""
+    final_path = Path(final_path)
+    directory = Path(staging_dir) if staging_dir else final_path.parent
+    token = uuid.uuid4().hex
+    return directory / f".{final_path.stem}{PARTIAL_MARKER}-{_host_tag()}-{os.getpid()}-{token}{final_path.suffix}"
+
+
+def is_partial(path):
+    return Path(path).name.startswith('.') and PARTIAL_MARKER in Path(path).name
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        import ctypes
+        # PROCESS_QUERY_LIMITED_INFORMATION; os.kill(pid, 0) would terminate the process on Windows
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clean_stale_partials(*directories):
+    """Remove staged files in directories written by processes on this host that no longer exist"""
+    host = _host_tag()
+    for directory in {Path(directory) for directory in directories if directory}:
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            match = PARTIAL_NAME.match(name)
+            # Another host's pids mean nothing here; its writer may still be running
+            if not match or match.group('host') != host:
+                continue
+            if int(match.group('pid')) == os.getpid() or _pid_alive(int(match.group('pid'))):
+                continue
+            try:
+                (directory / name).unlink()
+            except OSError:
+                pass
+
+
+def ensure_free_space(estimated_bytes, final_dir, staging_dir=None):
+    """Raise InsufficientSpaceError unless every device the output passes through has room for it"""
+    needed = estimated_bytes * (1 + SPACE_MARGIN_RATIO) + SPACE_MARGIN_BYTES
+    directories = {}
+    for directory in (staging_dir, final_dir):
+        if directory:
+            # A staged file on the final device is renamed, so that device only needs room once
+            directories.setdefault(os.stat(directory).st_dev, Path(directory))
+    for directory in directories.values():
+        free = shutil.disk_usage(directory).free
+        if free < needed:
+            raise InsufficientSpaceError(
+                f"Not enough free space in {directory}: needs {needed / 1024 / 1024:.1f} MB, "
+                f"{free / 1024 / 1024:.1f} MB free")
+
+
+def _fsync_path(path, flags):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_file(path):
+    # Windows only flushes handles opened for writing
+    _fsync_path(path, os.O_RDWR)
+
+
+def fsync_directory(path):
+    """Persist a rename; directories cannot be opened for fsync on Windows"""
+    if os.name == 'posix':
+        _fsync_path(path, os.O_RDONLY)
+
+
+def publish(staged_path, final_path):
+    """Durably move a finished staged file to final_path, replacing it atomically"""
+    staged_path = Path(staged_path)
+    final_path = Path(final_path)
+    with span('publish', 'io', path=str(final_path), bytes=staged_path.stat().st_size):
+        fsync_file(staged_path)
+        if os.stat(staged_path.parent).st_dev != os.stat(final_path.parent).st_dev:
+            # Across devices: copy next to the final file first, so the rename below is still atomic
+            local_path = staging_path_for(final_path)
+            try:
+                with open(staged_path, 'rb') as source, open(local_path, 'wb') as target:
+                    shutil.copyfileobj(source, target, COPY_BUFFER_BYTES)
+                    target.flush()
+                    os.fsync(target.fileno())
+                shutil.copystat(staged_path, local_path)
+            except BaseException:
+                if local_path.exists():
+                    local_path.unlink()
+                raise
+            staged_path.unlink()
+            staged_path = local_path
+        os.replace(staged_path, final_path)
+        fsync_directory(final_path.parent)
+    return final_path
+
+
+def discard(staged_path):
+    """Remove a staged file that will not be published"""
+    staged_path = Path(staged_path)
+    if staged_path.exists():
+        staged_path.unlink()
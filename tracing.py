@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracing
+三个工具共用的轻量级性能追踪
+
+Disabled by default, where a span costs one function call and a global check.
+Enable it with the PYTHON_TOOLS_TRACE environment variable or the --trace flag
+of any tool, both taking an output prefix:
+
+  PYTHON_TOOLS_TRACE=/tmp/run python audio_track_remover.py --cli movie.mkv
+  python pdf_genius.py --trace /tmp/run
+
+On exit this writes <prefix>.trace.json (Chrome trace_event format, open it in
+Perfetto or chrome://tracing) and <prefix>.metrics.jsonl (one JSON object per
+span with its duration and recorded values such as bytes or pages). Only the
+process that enabled tracing records it; ProcessPool workers stay untraced.
+
+    with span("write", "pdf", pages=len(pages)) as s:
+        ...
+        s.set("bytes", os.path.getsize(output_path))
+"""
+
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+
+ENV_VAR = 'PYTHON_TOOLS_TRACE'
+# pid of the process that owns the trace; worker processes inherit ENV_VAR but must not trace
+OWNER_ENV_VAR = 'PYTHON_TOOLS_TRACE_OWNER'
+
+_tracer = None
+_virtual_tids = itertools.count(1)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, category, args, tid):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.tid = tid
+
+    def set(self, key, value):
+        self.args[key] = value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = f"{exc_type.__name__}: {exc_value}"
+        self.tracer.record(self, self.start, end)
+        return False
+
+
+class Tracer:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.origin = time.perf_counter()
+        self.wall_origin = time.time()
+        self.pid = os.getpid()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def record(self, span, start, end):
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': span.tid if span.tid is not None else threading.get_ident(),
+            'args': span.args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def flush(self):
+        if os.getpid() != self.pid:
+            # A forked child inherited the tracer; only the owner writes the files
+            return
+        with self.lock:
+            events = list(self.events)
+        directory = os.path.dirname(self.prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.prefix}.trace.json", 'w', encoding='utf-8') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file, default=str)
+        with open(f"{self.prefix}.metrics.jsonl", 'w', encoding='utf-8') as metrics_file:
+            for event in events:
+                metrics_file.write(json.dumps({
+                    'name': event['name'],
+                    'category': event['cat'],
+                    'start': self.wall_origin + event['ts'] / 1e6,
+                    'duration_ms': event['dur'] / 1000,
+                    **event['args'],
+                }, default=str) + '\n')
+
+
+def enable(prefix):
+    """Start recording spans and write them to <prefix>.* at exit"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(prefix)
+        atexit.register(_tracer.flush)
+    return _tracer
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def span(name, category='app', tid=None, **args):
+    """Context manager timing a block; returns a shared no-op object when tracing is off.
+
+    Pass tid to put overlapping spans from one thread (e.g. asyncio jobs) on their own track.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, category, args, tid)
+
+
+def new_track_id():
+    """Return a fresh tid for spans that overlap on one OS thread"""
+    return 1_000_000 + next(_virtual_tids)
+
+
+def enable_from_argv(argv):
+    """Handle and remove '--trace <prefix>' from argv in place"""
+    if '--trace' in argv:
+        position = argv.index('--trace')
+        if position + 1 < len(argv):
+            enable(argv[position + 1])
+            del argv[position:position + 2]
+        else:
+            del argv[position]
+
+
+def _disable_in_child():
+    global _tracer
+    _tracer = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_disable_in_child)
+
+if os.environ.get(ENV_VAR) and os.environ.get(OWNER_ENV_VAR, str(os.getpid())) == str(os.getpid()):
+    os.environ[OWNER_ENV_VAR] = str(os.getpid())
+    enable(os.environ[ENV_VAR])
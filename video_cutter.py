@@ -1,8 +1,124 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from moviepy.editor import VideoFileClip
 import os
 import subprocess
+import sys
+
+from ffmpeg_engine import get_engine, progress_line_handler
+from mp4_layout import LAYOUTS, is_mp4_path, output_args, reserved_space_too_small, with_faststart_fallback
+from resource_governor import configure_from_argv
+from tracing import enable_from_argv, span
+
+
+def time_to_seconds(time_str):
+    try:
+        h, m, s = map(int, time_str.split(':'))
+        return h * 3600 + m * 60 + s
+    except:
+        raise ValueError("Invalid time format. Please use HH:MM:SS")
+
+
+def cut_with_ffmpeg(input_path, output_path, start_seconds, end_seconds, progress=None, mp4_layout=None):
+    cmd = [
+        "ffmpeg",
+        "-y",  # Overwrite output file without asking
+        "-ss", str(start_seconds),
+        "-to", str(end_seconds),
+        "-i", input_path,
+        "-c", "copy",
+    ]
+    on_stdout_line = None
+    if progress is not None:
+        cmd += ["-progress", "pipe:1", "-nostats"]
+        on_stdout_line = progress_line_handler(end_seconds - start_seconds, progress)
+    if mp4_layout and mp4_layout != "default" and is_mp4_path(output_path):
+        # Imported here: probing is only needed to size the reserved moov
+        from audio_track_remover import get_video_info
+        video_info = get_video_info(input_path) if mp4_layout == "faststart" else None
+        cmd += output_args(mp4_layout, output_path, video_info, end_seconds - start_seconds)
+    cmd.append(output_path)
+    with span("cut", "media", input=input_path, seconds=end_seconds - start_seconds) as cut_span:
+        result = get_engine().run(cmd, on_stdout_line=on_stdout_line)
+        if result.returncode != 0 and "-moov_size" in cmd and reserved_space_too_small(result.stderr):
+            cmd = with_faststart_fallback(cmd)
+            result = get_engine().run(cmd, on_stdout_line=on_stdout_line)
+        if result.returncode == 0:
+            cut_span.set("output_bytes", os.path.getsize(output_path))
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+
+
+def cut_with_moviepy(input_path, output_path, start_seconds, end_seconds):
+    # Imported here so the fast ffmpeg path works without MoviePy installed
+    from moviepy.editor import VideoFileClip
+
+    # MoviePy starts its own ffmpeg processes, so reserve their threads and disk with the governor
+    with get_engine().reserve([input_path, output_path]) as admission:
+        with span("moviepy_open", "media", input=input_path):
+            video = VideoFileClip(input_path)
+        try:
+            if end_seconds > video.duration:
+                raise ValueError("End time exceeds video duration")
+            cut_video = video.subclip(start_seconds, end_seconds)
+            with span("moviepy_encode", "media", seconds=end_seconds - start_seconds) as encode_span:
+                cut_video.write_videofile(
+                    output_path,
+                    codec="libx264",
+                    preset="ultrafast",
+                    threads=admission.threads
+                )
+                encode_span.set("output_bytes", os.path.getsize(output_path))
+            cut_video.close()
+        finally:
+            video.close()
+
+def run_cut_list(argv):
+    """Cut every row (input,start,end,output) of a CSV file, resuming from the journal after a crash"""
+    import argparse
+    import csv
+    from job_journal import JobJournal, JournalLockedError
+
+    parser = argparse.ArgumentParser(prog="video_cutter.py --cut-list",
+                                     description="Cut many clips without prompts")
+    parser.add_argument("csv_file", help="CSV rows: input,start HH:MM:SS,end HH:MM:SS,output")
+    parser.add_argument("--journal", help="Checkpoint journal (default: <csv_file>.journal)")
+    parser.add_argument("--mp4-layout", choices=LAYOUTS, default="default",
+                        help="For MP4 outputs: moov at the start (faststart) or fragmented MP4")
+    args = parser.parse_args(argv)
+
+    try:
+        journal = JobJournal(args.journal or args.csv_file + ".journal")
+    except JournalLockedError as e:
+        parser.error(str(e))
+    failed = 0
+    with open(args.csv_file, newline="", encoding="utf-8") as csv_file:
+        for row in csv.reader(csv_file):
+            if not row or row[0].startswith("#"):
+                continue
+            label = row[3].strip() if len(row) >= 4 else ",".join(row)
+            try:
+                if len(row) < 4:
+                    raise ValueError("expected input,start,end,output")
+                input_path, start, end, output_path = (field.strip() for field in row[:4])
+                start_seconds, end_seconds = time_to_seconds(start), time_to_seconds(end)
+
+                def cut():
+                    cut_with_ffmpeg(input_path, output_path, start_seconds, end_seconds, mp4_layout=args.mp4_layout)
+                    return True
+
+                params = {"start": start_seconds, "end": end_seconds}
+                if args.mp4_layout != "default":
+                    params["mp4_layout"] = args.mp4_layout
+                state = journal.run(input_path, output_path, params, cut)
+            except (OSError, ValueError) as e:
+                # A bad row (or a missing input) fails on its own; the rest of the list still runs
+                print(f"[failed] {label}: {e}")
+                failed += 1
+                continue
+            failed += state == "failed"
+            print(f"[{state}] {output_path}")
+    journal.close()
+    return 1 if failed else 0
 
 class VideoCutterApp:
     def __init__(self, root):
@@ -14,6 +130,7 @@ class VideoCutterApp:
         self.video_path = tk.StringVar()
         self.start_time = tk.StringVar()
         self.end_time = tk.StringVar()
+        self.mp4_layout = tk.StringVar(value="default")
         
         # Create GUI elements
         self.create_widgets()
@@ -34,6 +151,9 @@ class VideoCutterApp:
         tk.Label(time_frame, text="End Time (HH:MM:SS):").grid(row=1, column=0, padx=5)
         tk.Entry(time_frame, textvariable=self.end_time).grid(row=1, column=1, padx=5)
         
+        tk.Label(time_frame, text="MP4 Layout:").grid(row=2, column=0, padx=5)
+        tk.OptionMenu(time_frame, self.mp4_layout, *LAYOUTS).grid(row=2, column=1, padx=5, sticky="w")
+
         # Cut button
         tk.Button(self.root, text="Cut Video", command=self.cut_video).pack(pady=20)
         
@@ -48,23 +168,7 @@ class VideoCutterApp:
             self.video_path.set(filename)
             
     def time_to_seconds(self, time_str):
-        try:
-            h, m, s = map(int, time_str.split(':'))
-            return h * 3600 + m * 60 + s
-        except:
-            raise ValueError("Invalid time format. Please use HH:MM:SS")
-            
-    def cut_with_ffmpeg(self, input_path, output_path, start_seconds, end_seconds):
-        cmd = [
-            "ffmpeg",
-            "-y",  # Overwrite output file without asking
-            "-ss", str(start_seconds),
-            "-to", str(end_seconds),
-            "-i", input_path,
-            "-c", "copy",
-            output_path
-        ]
-        subprocess.run(cmd, check=True)
+        return time_to_seconds(time_str)
             
     def cut_video(self):
         try:
@@ -85,24 +189,15 @@ class VideoCutterApp:
             if not output_path:
                 return
             try:
-                self.cut_with_ffmpeg(video_path, output_path, start_seconds, end_seconds)
+                cut_with_ffmpeg(video_path, output_path, start_seconds, end_seconds,
+                                mp4_layout=self.mp4_layout.get())
                 messagebox.showinfo("Success", "Video cut successfully (fast mode)!")
             except Exception as ffmpeg_error:
                 try:
-                    video = VideoFileClip(video_path)
-                    if end_seconds > video.duration:
-                        messagebox.showerror("Error", "End time exceeds video duration")
-                        return
-                    cut_video = video.subclip(start_seconds, end_seconds)
-                    cut_video.write_videofile(
-                        output_path,
-                        codec="libx264",
-                        preset="ultrafast",
-                        threads=4
-                    )
-                    video.close()
-                    cut_video.close()
+                    cut_with_moviepy(video_path, output_path, start_seconds, end_seconds)
                     messagebox.showinfo("Success", "Video cut successfully (MoviePy fallback)!")
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
                 except Exception as e:
                     messagebox.showerror("Error", f"An error occurred: {str(e)}")
         except ValueError as e:
@@ -111,6 +206,10 @@ class VideoCutterApp:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
 if __name__ == "__main__":
+    enable_from_argv(sys.argv)
+    configure_from_argv(sys.argv)
+    if len(sys.argv) > 1 and sys.argv[1] == "--cut-list":
+        sys.exit(run_cut_list(sys.argv[2:]))
     root = tk.Tk()
     app = VideoCutterApp(root)
     root.mainloop()
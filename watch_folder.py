@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Watch Folder Daemon
+监视采集目录，文件写完后自动按策略删除音轨
+
+Usage:
+  python watch_folder.py <dir> [<dir> ...] --keep-lang jpn,eng --drop-title commentary
+  python audio_track_remover.py --watch <dir> ... (same options)
+
+Uses inotify on Linux and falls back to polling elsewhere. A file is treated as
+complete once its size has not changed for --stable-seconds. Add --background to run
+ffmpeg under nice/ionice, and --threads/--io-tokens to bound its load (see resource_governor.py).
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from audio_track_remover import VIDEO_EXTENSIONS, process_with_policy
+from job_journal import JOB_STATES, JobJournal, JournalLockedError
+from resource_governor import configure_from_argv
+from staged_output import is_partial
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Report files created, written or moved into the watched directories (Linux only)"""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directories = {}
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {directory}')
+            self.directories[wd] = Path(directory)
+
+    def wait(self, timeout):
+        """Return the paths that changed, waiting at most timeout seconds"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, _, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if name and wd in self.directories:
+                changed.add(self.directories[wd] / os.fsdecode(name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback watcher that rescans the directories every interval seconds"""
+
+    def __init__(self, directories, interval=5.0):
+        self.directories = [Path(directory) for directory in directories]
+        self.interval = interval
+        self.known = {}
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        for directory in self.directories:
+            for path in directory.iterdir():
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self.known.get(path) != signature:
+                    self.known[path] = signature
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(directories, poll_interval=5.0):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(directories, poll_interval)
+
+
+def output_path_for(file_path, output_dir=None):
+    return Path(output_dir or file_path.parent) / f"{file_path.stem}_cleaned{file_path.suffix}"
+
+
+def is_candidate(path, output_dir=None):
+    if path.suffix.lower() not in VIDEO_EXTENSIONS or path.stem.endswith('_cleaned') or is_partial(path):
+        return False
+    return path.is_file() and not output_path_for(path, output_dir).exists()
+
+
+class WatchFolderDaemon:
+    def __init__(self, directories, keep_languages, drop_title_patterns, output_dir=None,
+                 workers=2, stable_seconds=10.0, poll_interval=5.0, journal=None, staging_dir=None):
+        self.directories = directories
+        self.keep_languages = keep_languages
+        self.drop_title_patterns = drop_title_patterns
+        self.output_dir = output_dir
+        self.staging_dir = staging_dir
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Bound the backlog so a huge ingest burst does not queue unbounded work
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.pending = {}
+        self.in_progress = set()
+        self.stop_event = threading.Event()
+        self.journal = journal
+
+    def policy_params(self):
+        return {'keep_languages': self.keep_languages, 'drop_title_patterns': self.drop_title_patterns}
+
+    def _process(self, path):
+        try:
+            print(f"Processing: {path}", flush=True)
+            output_file = output_path_for(path, self.output_dir)
+
+            def process():
+                return process_with_policy(path, output_file, self.keep_languages, self.drop_title_patterns,
+                                           staging_dir=self.staging_dir)
+
+            if self.journal is None:
+                state = JOB_STATES[process()]
+            else:
+                state = self.journal.run(path, output_file, self.policy_params(), process)
+            print(f"{state.capitalize()}: {path}", flush=True)
+        except Exception as e:
+            print(f"Failed: {path}: {e}", flush=True)
+        finally:
+            self.in_progress.discard(path)
+            self.slots.release()
+
+    def _check_stable(self):
+        now = time.monotonic()
+        for path, (last_size, last_change) in list(self.pending.items()):
+            try:
+                size = path.stat().st_size
+            except OSError:
+                del self.pending[path]
+                continue
+            if size != last_size:
+                self.pending[path] = (size, now)
+            elif now - last_change >= self.stable_seconds and self.slots.acquire(blocking=False):
+                del self.pending[path]
+                self.in_progress.add(path)
+                self.executor.submit(self._process, path)
+
+    def run(self):
+        watcher = create_watcher(self.directories, self.poll_interval)
+        print(f"Watching: {', '.join(str(d) for d in self.directories)}", flush=True)
+
+        # Pick up files that arrived while the daemon was not running
+        for directory in self.directories:
+            for path in Path(directory).iterdir():
+                if is_candidate(path, self.output_dir):
+                    self.pending[path] = (None, time.monotonic())
+
+        try:
+            while not self.stop_event.is_set():
+                for path in watcher.wait(1.0):
+                    if path not in self.in_progress and is_candidate(path, self.output_dir):
+                        self.pending[path] = self.pending.get(path, (None, time.monotonic()))
+                self._check_stable()
+        finally:
+            watcher.close()
+            self.executor.shutdown(wait=True)
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Watch folders and remove audio tracks from new recordings')
+    parser.add_argument('directories', nargs='+')
+    parser.add_argument('--keep-lang', default='', help='Comma-separated languages to keep (e.g. jpn,eng)')
+    parser.add_argument('--drop-title', default='', help='Comma-separated title fragments to drop (e.g. commentary)')
+    parser.add_argument('--output-dir', help='Write cleaned files here instead of next to the input')
+    parser.add_argument('--staging-dir', help='Write temporary files here (e.g. a scratch SSD) before publishing')
+    parser.add_argument('--workers', type=int, default=2, help='Files processed at the same time')
+    parser.add_argument('--stable-seconds', type=float, default=10.0,
+                        help='Seconds a file size must stay unchanged before it is processed')
+    parser.add_argument('--poll-interval', type=float, default=5.0, help='Rescan interval when polling')
+    parser.add_argument('--journal', help='Record jobs in this journal so restarts skip finished files')
+    args = parser.parse_args(argv)
+
+    keep_languages = [lang.strip() for lang in args.keep_lang.split(',') if lang.strip()]
+    drop_title_patterns = [title.strip() for title in args.drop_title.split(',') if title.strip()]
+    if not keep_languages and not drop_title_patterns:
+        parser.error('a policy is required: --keep-lang and/or --drop-title')
+
+    try:
+        journal = JobJournal(args.journal) if args.journal else None
+    except JournalLockedError as e:
+        parser.error(str(e))
+    daemon = WatchFolderDaemon(args.directories, keep_languages, drop_title_patterns, args.output_dir,
+                               args.workers, args.stable_seconds, args.poll_interval,
+                               journal, args.staging_dir)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+
+
+if __name__ == '__main__':
+    configure_from_argv(sys.argv)
+    main()